@@ -0,0 +1,148 @@
+import os
+import warnings
+from datetime import date, timedelta
+
+import snapshots
+from metrics import timer, log_event
+
+# Flags accounts whose current value of a metric is far above its own recent history.
+# The history comes from the snapshot store (SNAPSHOT_DIR); each metric is pivoted into an
+# accounts x runs matrix and the baselines for all accounts are computed at once with a
+# rolling median and MAD (median absolute deviation), which a few past outliers don't skew.
+# numpy and pyarrow are imported only when detection runs.
+WINDOW_RUNS = int(os.getenv('ANOMALY_WINDOW_RUNS', '48'))  # Past runs forming the baseline
+HISTORY_DAYS = int(os.getenv('ANOMALY_HISTORY_DAYS', '60'))
+MIN_HISTORY = int(os.getenv('ANOMALY_MIN_HISTORY', '7'))  # Runs an account needs before it is judged
+THRESHOLD = float(os.getenv('ANOMALY_THRESHOLD', '3.5'))  # Robust z-score above which a value is flagged
+MIN_SCALE = 1.0  # One hour or one error; keeps perfectly flat histories from flagging tiny changes
+MAD_TO_SIGMA = 1.4826
+MAX_LISTED = 20
+
+# Metrics per report; error counts are summed over error codes per channel
+METRICS = {
+    'order_customer_sync': ['hours_since_order', 'hours_since_customer'],
+    'error_logging': ['email_errors', 'whatsapp_errors', 'sms_errors'],
+}
+METRIC_LABELS = {
+    'hours_since_order': 'hours since last order',
+    'hours_since_customer': 'hours since last new customer',
+    'email_errors': 'Email errors',
+    'whatsapp_errors': 'WhatsApp errors',
+    'sms_errors': 'SMS errors',
+}
+
+def current_values(report, rows):
+    """Returns (account_ids, display names, {metric: [value per account]}) for the run's rows."""
+    if report == 'order_customer_sync':
+        account_ids = [row[1] for row in rows]
+        names = [row[0] for row in rows]
+        values = {
+            'hours_since_order': [row[2] for row in rows],
+            'hours_since_customer': [row[3] for row in rows],
+        }
+    else:
+        account_ids = [row[0] for row in rows]
+        names = [row[1] for row in rows]
+        values = {
+            f"{channel.lower()}_errors": [sum(error[2] for error in row[2][channel]) for row in rows]
+            for channel in ('Email', 'WhatsApp', 'SMS')
+        }
+    return account_ids, names, values
+
+def history_matrices(np, report, account_ids):
+    """Pivots the stored history into {metric: accounts x runs float matrix}, NaN where missing."""
+    columns = ['run_at', 'account_id'] + (['channel', 'error_count'] if report == 'error_logging' else METRICS[report])
+    table = snapshots.load_history(report, since=date.today() - timedelta(days=HISTORY_DAYS), columns=columns)
+
+    ids = np.asarray(account_ids, dtype=np.int64)
+    order = np.argsort(ids)
+    sorted_ids = ids[order]
+    stored_ids = table.column('account_id').to_numpy()
+    runs, run_index = np.unique(table.column('run_at').to_numpy(), return_inverse=True)
+
+    # Map each stored row to its account's row in the matrix, dropping accounts no longer reported
+    position = np.searchsorted(sorted_ids, stored_ids).clip(max=len(ids) - 1)
+    known = sorted_ids[position] == stored_ids
+    account_index = order[position[known]]
+    run_index = run_index[known]
+
+    matrices = {}
+    if report == 'error_logging':
+        channels = table.column('channel').to_numpy(zero_copy_only=False)[known]
+        counts = np.asarray(table.column('error_count').to_numpy(zero_copy_only=False), dtype=float)[known]
+        present = np.zeros((len(ids), len(runs)), dtype=bool)
+        present[account_index, run_index] = True
+        for metric in METRICS[report]:
+            channel = {'email_errors': 'Email', 'whatsapp_errors': 'WhatsApp', 'sms_errors': 'SMS'}[metric]
+            matrix = np.zeros((len(ids), len(runs)))
+            mask = channels == channel
+            np.add.at(matrix, (account_index[mask], run_index[mask]), counts[mask])
+            matrix[~present] = np.nan
+            matrices[metric] = matrix
+    else:
+        for metric in METRICS[report]:
+            # Nulls ("N/A" hours) come back as NaN
+            values = np.asarray(table.column(metric).to_numpy(zero_copy_only=False), dtype=float)[known]
+            matrix = np.full((len(ids), len(runs)), np.nan)
+            matrix[account_index, run_index] = values
+            matrices[metric] = matrix
+    return matrices
+
+def detect(np, history, current):
+    """Scores current values against each account's history.
+
+    history is an accounts x runs matrix and current a vector per account. Returns
+    (flagged mask, baseline medians, robust z-scores).
+    """
+    window = history[:, -WINDOW_RUNS:]
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)  # Accounts without history yield NaN
+        median = np.nanmedian(window, axis=1)
+        mad = np.nanmedian(np.abs(window - median[:, None]), axis=1)
+    scale = np.maximum(MAD_TO_SIGMA * mad, MIN_SCALE)
+    score = (current - median) / scale
+    enough_history = np.count_nonzero(~np.isnan(window), axis=1) >= MIN_HISTORY
+    with np.errstate(invalid='ignore'):
+        flagged = enough_history & (score > THRESHOLD)
+    return flagged, median, score
+
+def find_anomalies(report, rows):
+    """Returns anomaly dicts for the run's rows, worst first, or [] when there's no history to compare.
+
+    Call it before the run is recorded, so the current values aren't part of their own baseline.
+    """
+    if not snapshots.SNAPSHOT_DIR or report not in METRICS or not rows:
+        return []
+    try:
+        import numpy as np
+        with timer('anomaly_detection'):
+            account_ids, names, values = current_values(report, rows)
+            matrices = history_matrices(np, report, account_ids)
+            anomalies = []
+            for metric in METRICS[report]:
+                current = np.asarray([np.nan if value is None else value for value in values[metric]], dtype=float)
+                flagged, median, score = detect(np, matrices[metric], current)
+                for index in np.flatnonzero(flagged):
+                    anomalies.append({
+                        'account_id': account_ids[index], 'display_name': names[index], 'metric': metric,
+                        'value': float(current[index]), 'baseline': float(median[index]), 'score': float(score[index]),
+                    })
+    except Exception as e:
+        log_event('warning', stage='anomaly_detection', error=str(e))
+        return []
+    anomalies.sort(key=lambda anomaly: anomaly['score'], reverse=True)
+    for anomaly in anomalies:
+        log_event('anomaly', **anomaly)
+    return anomalies
+
+def format_anomalies(anomalies):
+    """Builds the Slack section listing anomalies, or an empty string when there are none."""
+    if not anomalies:
+        return ""
+    text = "\n\n🚨 Unusual values compared with each account's recent runs:\n"
+    for anomaly in anomalies[:MAX_LISTED]:
+        text += (f"• {anomaly['display_name']} ({anomaly['account_id']}): {METRIC_LABELS[anomaly['metric']]} "
+                 f"{anomaly['value']:.0f} (usually {anomaly['baseline']:.0f})\n")
+    if len(anomalies) > MAX_LISTED:
+        text += f"…and {len(anomalies) - MAX_LISTED} more\n"
+    return text
@@ -1,142 +1,183 @@
-import os
-import psycopg2
-import requests
+import argparse
 from datetime import datetime
+import metrics
+from db import connect_db, set_account
+from metrics import timer, log_event
+from notifier import send_messages
+from slack_tables import render_messages, message_text
+from display_names import get_display_names
+from snapshots import record_snapshot
+from audience_rollup import refresh_rollup, fetch_summary_rollup
+from fixtures import add_fixture_arguments, start_fixtures, stop_fixtures
+from roster import add_roster_arguments, load_roster, resolve_accounts, roster_order, write_shard_output
 
 # Load environment variables from a .env file or directly from the environment
 from dotenv import load_dotenv
 load_dotenv()
 
-# Database connection
-try:
-    conn = psycopg2.connect(
-        dbname=os.getenv('DB_NAME'),
-        user=os.getenv('DB_USER'),
-        password=os.getenv('DB_PASSWORD'),
-        host=os.getenv('DB_HOST'),
-        port=os.getenv('DB_PORT')
-    )
-except Exception as e:
-    print(f"Error connecting to the database: {e}")
-    exit(1)
-
-# Slack Bot User OAuth Access Token
-slack_token = os.getenv('SLACK_BOT_TOKEN')
-channel_id = os.getenv('SLACK_CHANNEL_ID')
-
-# Function to send message to Slack
-def send_to_slack(message):
-    url = os.getenv('SLACK_WEBHOOK_URL')
-    headers = {
-        'Authorization': f'Bearer {slack_token}',
-        'Content-Type': 'application/json'
-    }
-    payload = {
-        'channel': channel_id,
-        'text': message,
-        'mrkdwn': True
-    }
-    response = requests.post(url, headers=headers, json=payload)
-    print(response.text)
-    if not response.ok or not response.json().get('ok'):
-        raise ValueError(f'Request to Slack returned an error: {response.text}')
-
-try:
+# Per-account aggregation run after set_account, for accounts whose rows are only visible in their own context
+account_summary_query = """
+SELECT
+    COUNT(*) AS total_audience_count,
+    COUNT(*) FILTER (WHERE updated_at >= CURRENT_DATE) AS updated_today_count,
+    COUNT(*) FILTER (WHERE updated_at < CURRENT_DATE) AS not_updated_today_count,
+    MAX(updated_at) FILTER (WHERE updated_at < CURRENT_DATE) AS latest_not_updated
+FROM
+    pf.audiences
+WHERE
+    account_id = %s
+    AND deleted_at IS NULL
+    AND is_used = 'false'
+    AND slug NOT LIKE 'rt_coll%%'
+    AND slug NOT LIKE 'rt_prod%%';
+"""
+
+# Set-based aggregation: one GROUP BY pass over pf.audiences for every account.
+# Display names come from the shared cache rather than a join on pf.account.
+audience_summary_query = """
+SELECT
+    a.id AS account_id,
+    COUNT(au.account_id) AS total_audience_count,
+    COUNT(au.account_id) FILTER (WHERE au.updated_at >= CURRENT_DATE) AS updated_today_count,
+    COUNT(au.account_id) FILTER (WHERE au.updated_at < CURRENT_DATE) AS not_updated_today_count,
+    MAX(au.updated_at) FILTER (WHERE au.updated_at < CURRENT_DATE) AS latest_not_updated
+FROM
+    unnest(%s::BIGINT[]) AS a(id)
+    LEFT JOIN pf.audiences au
+        ON au.account_id = a.id
+        AND au.deleted_at IS NULL
+        AND au.is_used = 'false'
+        AND au.slug NOT LIKE 'rt_coll%%'
+        AND au.slug NOT LIKE 'rt_prod%%'
+GROUP BY
+    a.id;
+"""
+
+def fetch_account_summary(cursor, account_id):
+    """Aggregates one account's audiences; the account's context must already be set."""
+    with timer('query', query='account_summary'):
+        cursor.execute(account_summary_query, (account_id,))
+        return cursor.fetchone()
+
+def fetch_summary_loop(cursor, account_ids):
+    """Sets each account's context and aggregates its audiences in one query, returning typed rows."""
+    display_names = get_display_names(cursor, account_ids)
+
+    rows = []
+    for account_id in account_ids:
+        if account_id not in display_names:
+            continue
+        with timer('account', account=account_id):
+            set_account(cursor, account_id)
+            rows.append((display_names[account_id], account_id) + fetch_account_summary(cursor, account_id))
+    return rows
+
+def with_display_names(cursor, rows):
+    """Prepends cached display names to (account_id, ...) rows, dropping accounts missing from pf.account."""
+    display_names = get_display_names(cursor, [row[0] for row in rows])
+    return [(display_names[row[0]],) + tuple(row) for row in rows if row[0] in display_names]
+
+def fetch_summary_set(cursor, account_ids):
+    """Computes all counts for every account in a single GROUP BY pass."""
+    with timer('query', query='audience_summary'):
+        cursor.execute(audience_summary_query, (account_ids,))
+        rows = cursor.fetchall()
+    return with_display_names(cursor, rows)
+
+TITLE = "📊 Daily Audience Update Summary"
+TABLE_HEADER = [
+    "| Account Name        | Account ID          | Total Audiences | Updated Today | Not Updated Today (Latest Updated At) |",
+    "|---------------------|---------------------|-----------------|---------------|---------------------------------------|",
+]
+
+def table_lines(rows):
+    """Yields one table line per typed summary row."""
+    for display_name, account_id, total_count, updated_today, not_updated_today, latest in rows:
+        not_updated_today_latest = f"{not_updated_today} ({latest if latest is not None else 'N/A'})"
+        yield f"| {display_name or 'N/A':<20} | {account_id:<19} | {total_count:<16} | {updated_today:<13} | {not_updated_today_latest} |"
+
+def build_messages(rows):
+    """Builds the Slack summary from typed summary rows, split into a message and its threaded replies."""
+    return render_messages(TITLE, TABLE_HEADER, table_lines(rows))
+
+def collect(conn, account_ids, mode='loop'):
+    """Fetches typed audience summary rows for the accounts, in roster order."""
+    if mode == 'rollup':
+        with timer('refresh'):
+            recomputed = refresh_rollup(conn, account_ids)
+        log_event('rollup_refreshed', recomputed=recomputed, accounts=len(account_ids))
+
     with conn:
         with conn.cursor() as cursor:
-            cursor.execute("CREATE TEMP TABLE temp_results (result TEXT);")
-
-            cursor.execute("""
-            DO $$
-            DECLARE
-                account_record RECORD;
-                total_audience_count INTEGER;
-                updated_today_count INTEGER;
-                not_updated_today_count INTEGER;
-                latest_not_updated TIMESTAMP;
-                result TEXT := '';
-            BEGIN
-                FOR account_record IN 
-                    SELECT id AS account_id, display_name
-                    FROM pf.account
-                    WHERE id IN (
-                        221218718049371529,
-                        318376149853931305,
-                        189857344031557017,
-                        308857572440410099,
-                        196436990147692145,
-                        353789014706227026,
-                        328385381068178508
-                    )
-                LOOP
-                    PERFORM set_account(account_record.account_id);
-
-                    SELECT COUNT(*) INTO total_audience_count
-                    FROM pf.audiences
-                    WHERE account_id = account_record.account_id
-                    AND deleted_at IS NULL
-                    AND is_used = 'false'
-                    AND slug NOT LIKE 'rt_coll%'
-                    AND slug NOT LIKE 'rt_prod%';
-
-                    SELECT COUNT(*) INTO updated_today_count
-                    FROM pf.audiences
-                    WHERE account_id = account_record.account_id
-                    AND deleted_at IS NULL
-                    AND is_used = 'false'
-                    AND updated_at >= CURRENT_DATE
-                    AND slug NOT LIKE 'rt_coll%'
-                    AND slug NOT LIKE 'rt_prod%';
-
-                    SELECT COUNT(*), MAX(updated_at) INTO not_updated_today_count, latest_not_updated
-                    FROM pf.audiences
-                    WHERE account_id = account_record.account_id
-                    AND deleted_at IS NULL
-                    AND is_used = 'false'
-                    AND updated_at < CURRENT_DATE
-                    AND slug NOT LIKE 'rt_coll%'
-                    AND slug NOT LIKE 'rt_prod%';
-
-                    result := result || format(
-                        '%s | %s | %s | %s | %s (%s)\n',
-                        account_record.display_name,
-                        account_record.account_id,
-                        total_audience_count::TEXT,
-                        updated_today_count::TEXT,
-                        not_updated_today_count::TEXT,
-                        COALESCE(latest_not_updated::TEXT, 'N/A')
-                    );
-                END LOOP;
-
-                INSERT INTO temp_results (result) VALUES (result);
-            END $$;
-            """)
-
-            cursor.execute("SELECT result FROM temp_results;")
-            result = cursor.fetchone()[0]
-
-            # Create the complete message with header and table
-            slack_message = "📊 Daily Audience Update Summary\n\n"  # Add the header
-            slack_message += "```\n"
-            slack_message += "| Account Name        | Account ID          | Total Audiences | Updated Today | Not Updated Today (Latest Updated At) |\n"
-            slack_message += "|---------------------|---------------------|-----------------|---------------|---------------------------------------|\n"
-
-            for line in result.split('\n'):
-                if line.strip():
-                    display_name, account_id, total_count, updated_today, not_updated_today_latest = line.split('|')
-                    slack_message += f"| {display_name.strip():<20} | {account_id.strip():<19} | {total_count.strip():<16} | {updated_today.strip():<13} | {not_updated_today_latest.strip()} |\n"
-            
-            slack_message += "```"
-
-    # Print the result to the terminal
-    print(slack_message)
+            with timer('collect', mode=mode):
+                if mode == 'loop':
+                    rows = fetch_summary_loop(cursor, account_ids)
+                elif mode == 'rollup':
+                    rows = with_display_names(cursor, fetch_summary_rollup(cursor, account_ids))
+                else:
+                    rows = fetch_summary_set(cursor, account_ids)
+    log_event('collected', accounts=len(rows), mode=mode)
+
+    # Keep the roster order so both modes produce the same table
+    return roster_order(rows, account_ids)
+
+def deliver(rows):
+    """Records the audience summary, prints it and posts it to Slack."""
+    record_snapshot('audience', rows)
+
+    # Create the messages with header and table
+    with timer('format'):
+        messages = build_messages(rows)
+
+    # Log the result for the terminal and log collectors
+    for part, message in enumerate(messages, 1):
+        log_event('slack_message', part=part, parts=len(messages), text=message_text(message))
 
     # Send to Slack
-    send_to_slack(slack_message)
-
-except Exception as e:
-    print(f"Error executing SQL: {e}")
-
-finally:
-    if conn:
-        conn.close()
+    send_messages(messages)
+
+def run(conn, mode='loop', account_ids=None):
+    """Fetches the audience summary, prints it and posts it to Slack."""
+    rows = collect(conn, load_roster() if account_ids is None else account_ids, mode)
+    deliver(rows)
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description="Daily audience update summary.")
+    parser.add_argument('--mode', choices=['set', 'loop', 'rollup'], default='loop',
+                        help="'loop' aggregates per account after set_account; 'set' aggregates all accounts in one GROUP BY pass "
+                             "and 'rollup' incrementally refreshes and reads pf.audience_daily_rollup, both without set_account, "
+                             "so they need a database role that sees every account's audiences")
+    add_roster_arguments(parser)
+    add_fixture_arguments(parser)
+    args = parser.parse_args()
+    metrics.set_report('audience')
+    start_fixtures(args)
+
+    # Database connection
+    try:
+        conn = connect_db()
+    except Exception as e:
+        log_event('error', stage='connect', error=str(e))
+        metrics.export()
+        exit(1)
+
+    try:
+        account_ids = resolve_accounts(args, conn)
+        rows = collect(conn, account_ids, args.mode)
+        if args.shard_output:
+            write_shard_output(args.shard_output, 'audience', rows)
+        else:
+            deliver(rows)
+
+    except Exception as e:
+        log_event('error', stage='report', error=str(e))
+
+    finally:
+        if conn:
+            conn.close()
+        stop_fixtures()
+        metrics.export()
+
+if __name__ == "__main__":
+    main()
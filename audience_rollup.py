@@ -0,0 +1,226 @@
+import os
+import argparse
+from datetime import timedelta
+from dotenv import load_dotenv
+import metrics
+from db import connect_db
+from metrics import timer, log_event
+from roster import add_roster_arguments, resolve_accounts
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Per-account, per-day audience summary maintained incrementally from pf.audiences.
+# Every bucket applies the same slug filters as the audience report.
+rollup_schema = """
+CREATE TABLE IF NOT EXISTS pf.audience_daily_rollup (
+    account_id BIGINT NOT NULL,
+    rollup_date DATE NOT NULL,
+    total_count INTEGER NOT NULL,              -- not deleted, not used
+    updated_today_count INTEGER NOT NULL,      -- ... and updated on rollup_date
+    not_updated_today_count INTEGER NOT NULL,  -- ... and last updated before rollup_date
+    latest_not_updated TIMESTAMP,
+    used_count INTEGER NOT NULL,               -- not deleted, used
+    deleted_count INTEGER NOT NULL,
+    max_updated_at TIMESTAMP,                  -- latest updated_at among not deleted, not used
+    refreshed_at TIMESTAMP NOT NULL,
+    PRIMARY KEY (account_id, rollup_date)
+);
+
+CREATE TABLE IF NOT EXISTS pf.audience_rollup_state (
+    id INTEGER PRIMARY KEY DEFAULT 1 CHECK (id = 1),
+    last_refresh_at TIMESTAMP  -- Latest refresh of any roster; change detection uses each account's refreshed_at
+);
+
+INSERT INTO pf.audience_rollup_state (id, last_refresh_at) VALUES (1, NULL) ON CONFLICT DO NOTHING;
+"""
+
+# Writers stamp updated_at/deleted_at before they commit, so a row stamped just before a refresh
+# started can become visible only after it. The changed-accounts probe therefore looks back this
+# far before the account's last refresh; recomputing an account that didn't change is harmless.
+CHANGE_OVERLAP = timedelta(seconds=int(os.getenv('ROLLUP_CHANGE_OVERLAP_SECONDS', '900')))
+
+# Each account's last refresh is the refreshed_at of its latest rollup row, so refreshes of
+# different rosters or shards never move another account's watermark
+last_refreshed_query = """
+SELECT DISTINCT ON (account_id) account_id, refreshed_at
+FROM pf.audience_daily_rollup
+WHERE account_id = ANY(%s)
+ORDER BY account_id, rollup_date DESC;
+"""
+
+# Accounts with audience rows changed since their own last refresh
+changed_accounts_query = """
+WITH last AS (
+    SELECT * FROM unnest(%(account_ids)s::BIGINT[], %(since)s::TIMESTAMP[]) AS l(account_id, since)
+)
+SELECT au.account_id FROM pf.audiences au JOIN last ON au.account_id = last.account_id
+WHERE au.updated_at > last.since
+UNION
+SELECT au.account_id FROM pf.audiences au JOIN last ON au.account_id = last.account_id
+WHERE au.deleted_at > last.since;
+"""
+
+# Recomputes today's row for the given accounts from pf.audiences
+recompute_query = """
+INSERT INTO pf.audience_daily_rollup (
+    account_id, rollup_date, total_count, updated_today_count, not_updated_today_count,
+    latest_not_updated, used_count, deleted_count, max_updated_at, refreshed_at
+)
+SELECT
+    a.id,
+    CURRENT_DATE,
+    COUNT(au.account_id) FILTER (WHERE au.deleted_at IS NULL AND au.is_used = 'false'),
+    COUNT(au.account_id) FILTER (WHERE au.deleted_at IS NULL AND au.is_used = 'false' AND au.updated_at >= CURRENT_DATE),
+    COUNT(au.account_id) FILTER (WHERE au.deleted_at IS NULL AND au.is_used = 'false' AND au.updated_at < CURRENT_DATE),
+    MAX(au.updated_at) FILTER (WHERE au.deleted_at IS NULL AND au.is_used = 'false' AND au.updated_at < CURRENT_DATE),
+    COUNT(au.account_id) FILTER (WHERE au.deleted_at IS NULL AND au.is_used = 'true'),
+    COUNT(au.account_id) FILTER (WHERE au.deleted_at IS NOT NULL),
+    MAX(au.updated_at) FILTER (WHERE au.deleted_at IS NULL AND au.is_used = 'false'),
+    %(refreshed_at)s
+FROM
+    unnest(%(account_ids)s::BIGINT[]) AS a(id)
+    LEFT JOIN pf.audiences au
+        ON au.account_id = a.id
+        AND au.slug NOT LIKE 'rt_coll%%'
+        AND au.slug NOT LIKE 'rt_prod%%'
+GROUP BY
+    a.id
+ON CONFLICT (account_id, rollup_date) DO UPDATE SET
+    total_count = EXCLUDED.total_count,
+    updated_today_count = EXCLUDED.updated_today_count,
+    not_updated_today_count = EXCLUDED.not_updated_today_count,
+    latest_not_updated = EXCLUDED.latest_not_updated,
+    used_count = EXCLUDED.used_count,
+    deleted_count = EXCLUDED.deleted_count,
+    max_updated_at = EXCLUDED.max_updated_at,
+    refreshed_at = EXCLUDED.refreshed_at;
+"""
+
+# Accounts without changes keep their counts; on a new day everything moves into "not updated today".
+# A row already written today only gets the new refreshed_at, which is the account's watermark.
+carry_forward_query = """
+INSERT INTO pf.audience_daily_rollup (
+    account_id, rollup_date, total_count, updated_today_count, not_updated_today_count,
+    latest_not_updated, used_count, deleted_count, max_updated_at, refreshed_at
+)
+SELECT DISTINCT ON (account_id)
+    account_id,
+    CURRENT_DATE,
+    total_count,
+    0,
+    total_count,
+    max_updated_at,
+    used_count,
+    deleted_count,
+    max_updated_at,
+    %(refreshed_at)s
+FROM
+    pf.audience_daily_rollup
+WHERE
+    account_id = ANY(%(account_ids)s)
+    AND rollup_date <= CURRENT_DATE
+ORDER BY
+    account_id, rollup_date DESC
+ON CONFLICT (account_id, rollup_date) DO UPDATE SET refreshed_at = EXCLUDED.refreshed_at;
+"""
+
+# The report rows without display names, which the report adds from its name cache
+rollup_summary_query = """
+SELECT
+    r.account_id,
+    r.total_count,
+    r.updated_today_count,
+    r.not_updated_today_count,
+    r.latest_not_updated
+FROM
+    pf.audience_daily_rollup r
+WHERE
+    r.account_id = ANY(%s)
+    AND r.rollup_date = CURRENT_DATE;
+"""
+
+history_query = """
+SELECT
+    rollup_date, total_count, updated_today_count, not_updated_today_count,
+    latest_not_updated, used_count, deleted_count, max_updated_at
+FROM
+    pf.audience_daily_rollup
+WHERE
+    account_id = %s
+    AND rollup_date >= CURRENT_DATE - %s
+ORDER BY
+    rollup_date;
+"""
+
+def refresh_rollup(conn, account_ids, full=False):
+    """Brings today's rollup rows up to date, recomputing only accounts changed since the last refresh.
+
+    Returns the number of accounts recomputed from pf.audiences.
+    """
+    with conn:
+        with conn.cursor() as cursor:
+            cursor.execute(rollup_schema)
+            # Serializes concurrent refreshes on the state row
+            cursor.execute("SELECT LOCALTIMESTAMP FROM pf.audience_rollup_state WHERE id = 1 FOR UPDATE;")
+            refreshed_at = cursor.fetchone()[0]
+
+            if full:
+                changed = set(account_ids)
+            else:
+                cursor.execute(last_refreshed_query, (account_ids,))
+                last_refreshed = dict(cursor.fetchall())
+                with timer('query', query='rollup_changed_accounts'):
+                    cursor.execute(changed_accounts_query, {
+                        'account_ids': list(last_refreshed),
+                        'since': [refreshed - CHANGE_OVERLAP for refreshed in last_refreshed.values()],
+                    })
+                    changed = {row[0] for row in cursor.fetchall()}
+                # Accounts new to the rollup have no history to carry forward
+                changed |= set(account_ids) - set(last_refreshed)
+
+            unchanged = [account_id for account_id in account_ids if account_id not in changed]
+            if changed:
+                with timer('query', query='rollup_recompute'):
+                    cursor.execute(recompute_query, {'account_ids': sorted(changed), 'refreshed_at': refreshed_at})
+            if unchanged:
+                with timer('query', query='rollup_carry_forward'):
+                    cursor.execute(carry_forward_query, {'account_ids': unchanged, 'refreshed_at': refreshed_at})
+
+            # Rows stamped after refreshed_at, or stamped earlier but committed after this refresh's
+            # snapshot (within CHANGE_OVERLAP), are picked up by the account's next refresh
+            cursor.execute("UPDATE pf.audience_rollup_state SET last_refresh_at = %s WHERE id = 1;", (refreshed_at,))
+    return len(changed)
+
+def fetch_summary_rollup(cursor, account_ids):
+    """Reads today's (account_id, counts..., latest_not_updated) rows from the rollup table."""
+    with timer('query', query='rollup_summary'):
+        cursor.execute(rollup_summary_query, (account_ids,))
+        return cursor.fetchall()
+
+def fetch_history(cursor, account_id, days=30):
+    """Returns the account's daily rollup rows for the last N days."""
+    cursor.execute(history_query, (account_id, days))
+    return cursor.fetchall()
+
+def main():
+    parser = argparse.ArgumentParser(description="Refreshes the daily audience rollup table.")
+    parser.add_argument('--full', action='store_true', help="Recompute every account instead of only changed ones")
+    add_roster_arguments(parser)
+    args = parser.parse_args()
+    metrics.set_report('audience_rollup')
+
+    conn = connect_db()
+    try:
+        account_ids = resolve_accounts(args, conn)
+        with timer('refresh'):
+            recomputed = refresh_rollup(conn, account_ids, args.full)
+        log_event('rollup_refreshed', recomputed=recomputed, accounts=len(account_ids))
+    except Exception as e:
+        log_event('error', stage='refresh', error=str(e))
+    finally:
+        conn.close()
+        metrics.export()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+import os
+import time
+import argparse
+import psycopg2
+
+SCHEMA_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'schema.sql')
+
+# Synthetic account IDs start here so they look like the production snowflake-style IDs
+ACCOUNT_ID_BASE = 100000000000000000
+
+# Rows written per INSERT statement, so large scales don't build one huge transaction
+ROWS_PER_BATCH = 1_000_000
+
+TABLES = [
+    'pf.audiences',
+    'pf.email_queue_id_status',
+    'pf.whatsapp_wamid_status',
+    'pf.sms_queue_id_status',
+    'pf.wh_ecom_order',
+    'pf.wh_customer',
+    'pf.account',
+]
+
+# Per-table generators; each inserts per_account rows for every account in %(account_ids)s
+audiences_insert = """
+INSERT INTO pf.audiences (account_id, slug, is_used, deleted_at, updated_at)
+SELECT
+    a.id,
+    CASE
+        WHEN random() < 0.05 THEN 'rt_coll_'
+        WHEN random() < 0.05 THEN 'rt_prod_'
+        ELSE 'aud_'
+    END || g,
+    random() < 0.3,
+    CASE WHEN random() < 0.05 THEN LOCALTIMESTAMP - random() * INTERVAL '30 days' END,
+    LOCALTIMESTAMP - random() * INTERVAL '3 days'
+FROM
+    unnest(%(account_ids)s::BIGINT[]) AS a(id),
+    generate_series(1, %(per_account)s) AS g;
+"""
+
+channel_insert = """
+INSERT INTO {table} (account_id, status, status_update_at, errors)
+SELECT
+    a.id,
+    CASE WHEN random() < %(failure_rate)s THEN 'failed' ELSE 'delivered' END,
+    NOW() - random() * INTERVAL '48 hours',
+    CASE WHEN random() < 0.02 THEN NULL ELSE jsonb_build_object(
+        'code', 'E' || floor(random() * %(error_codes)s)::INT,
+        '{message_key}', 'Provider message variant ' || floor(random() * 5)::INT
+    ) END
+FROM
+    unnest(%(account_ids)s::BIGINT[]) AS a(id),
+    generate_series(1, %(per_account)s) AS g;
+"""
+
+orders_insert = """
+INSERT INTO pf.wh_ecom_order (account_id, order_date)
+SELECT a.id, LOCALTIMESTAMP - random() * INTERVAL '90 days'
+FROM unnest(%(account_ids)s::BIGINT[]) AS a(id), generate_series(1, %(per_account)s) AS g;
+"""
+
+customers_insert = """
+INSERT INTO pf.wh_customer (account_id, cust_created_at)
+SELECT a.id, LOCALTIMESTAMP - random() * INTERVAL '90 days'
+FROM unnest(%(account_ids)s::BIGINT[]) AS a(id), generate_series(1, %(per_account)s) AS g;
+"""
+
+# Baseline indexes; the index advisor can recommend better ones
+basic_indexes = [
+    "CREATE INDEX IF NOT EXISTS audiences_account_id_idx ON pf.audiences (account_id);",
+    "CREATE INDEX IF NOT EXISTS email_queue_id_status_account_id_idx ON pf.email_queue_id_status (account_id);",
+    "CREATE INDEX IF NOT EXISTS whatsapp_wamid_status_account_id_idx ON pf.whatsapp_wamid_status (account_id);",
+    "CREATE INDEX IF NOT EXISTS sms_queue_id_status_account_id_idx ON pf.sms_queue_id_status (account_id);",
+    "CREATE INDEX IF NOT EXISTS wh_ecom_order_account_id_idx ON pf.wh_ecom_order (account_id);",
+    "CREATE INDEX IF NOT EXISTS wh_customer_account_id_idx ON pf.wh_customer (account_id);",
+]
+
+def synthetic_account_ids(accounts):
+    """Returns the IDs used for a synthetic roster of the given size."""
+    return [ACCOUNT_ID_BASE + n for n in range(accounts)]
+
+def insert_per_account(cursor, query, account_ids, per_account, params=None):
+    """Runs a per-account generator over the roster in batches of about ROWS_PER_BATCH rows."""
+    if per_account <= 0:
+        return
+    accounts_per_batch = max(1, ROWS_PER_BATCH // per_account)
+    for start in range(0, len(account_ids), accounts_per_batch):
+        batch = account_ids[start:start + accounts_per_batch]
+        cursor.execute(query, {'account_ids': batch, 'per_account': per_account, **(params or {})})
+        cursor.connection.commit()
+
+def generate(conn, args):
+    """Creates the schema and fills it with synthetic data at the requested scale."""
+    account_ids = synthetic_account_ids(args.accounts)
+
+    with conn.cursor() as cursor:
+        with open(SCHEMA_FILE) as f:
+            cursor.execute(f.read())
+        if args.reset:
+            cursor.execute(f"TRUNCATE {', '.join(TABLES)};")
+        conn.commit()
+
+        cursor.execute(
+            "INSERT INTO pf.account (id, display_name) SELECT id, 'Account ' || (id - %s) FROM unnest(%s::BIGINT[]) AS id ON CONFLICT DO NOTHING;",
+            (ACCOUNT_ID_BASE, account_ids)
+        )
+        conn.commit()
+
+        phases = [
+            ('pf.audiences', audiences_insert, args.audiences, {}),
+            ('pf.email_queue_id_status', channel_insert.format(table='pf.email_queue_id_status', message_key='message'), args.channel_rows,
+             {'failure_rate': args.failure_rate, 'error_codes': args.error_codes}),
+            ('pf.whatsapp_wamid_status', channel_insert.format(table='pf.whatsapp_wamid_status', message_key='message'), args.channel_rows,
+             {'failure_rate': args.failure_rate, 'error_codes': args.error_codes}),
+            ('pf.sms_queue_id_status', channel_insert.format(table='pf.sms_queue_id_status', message_key='error'), args.channel_rows,
+             {'failure_rate': args.failure_rate, 'error_codes': args.error_codes}),
+            ('pf.wh_ecom_order', orders_insert, args.orders, {}),
+            ('pf.wh_customer', customers_insert, args.customers, {}),
+        ]
+        for table, query, per_account, params in phases:
+            started = time.perf_counter()
+            insert_per_account(cursor, query, account_ids, per_account, params)
+            print(f"{table}: {len(account_ids) * per_account} rows in {time.perf_counter() - started:.1f}s")
+
+        if args.indexes == 'basic':
+            for statement in basic_indexes:
+                cursor.execute(statement)
+            conn.commit()
+
+    conn.autocommit = True
+    with conn.cursor() as cursor:
+        cursor.execute("ANALYZE;")
+    return account_ids
+
+def main():
+    parser = argparse.ArgumentParser(description="Loads synthetic report data into a local PostgreSQL database.")
+    parser.add_argument('--dsn', default=os.getenv('BENCH_DSN'), required=not os.getenv('BENCH_DSN'),
+                        help="Benchmark database DSN (default: BENCH_DSN); never point this at production")
+    parser.add_argument('--accounts', type=int, default=100, help="Number of accounts (10 to 10,000)")
+    parser.add_argument('--audiences', type=int, default=1000, help="Audience rows per account")
+    parser.add_argument('--channel-rows', type=int, default=5000, help="Status rows per account in each channel table")
+    parser.add_argument('--orders', type=int, default=2000, help="Order rows per account")
+    parser.add_argument('--customers', type=int, default=1000, help="Customer rows per account")
+    parser.add_argument('--error-codes', type=int, default=40, help="Distinct provider error codes per channel")
+    parser.add_argument('--failure-rate', type=float, default=0.2, help="Share of status rows that failed")
+    parser.add_argument('--indexes', choices=['basic', 'none'], default='basic')
+    parser.add_argument('--reset', action='store_true', help="Truncate existing synthetic data first")
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(args.dsn)
+    try:
+        started = time.perf_counter()
+        account_ids = generate(conn, args)
+        print(f"Generated data for {len(account_ids)} accounts in {time.perf_counter() - started:.1f}s")
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    main()
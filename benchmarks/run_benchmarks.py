@@ -0,0 +1,151 @@
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import threading
+import platform
+from datetime import datetime, timezone
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import psycopg2
+
+# Make the report scripts importable when run as benchmarks/run_benchmarks.py
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import audience_check_demo
+import error_logging_demo
+import order_customer_sync_demo
+from notifier import send_to_slack, send_messages
+from sheet_writer import SheetWriter, CsvSheet
+
+class SlackStubHandler(BaseHTTPRequestHandler):
+    """Accepts chat.postMessage-style requests and answers like Slack does."""
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        body = b'{"ok": true}'
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def start_slack_stub():
+    """Starts a local Slack stand-in and points SLACK_WEBHOOK_URL at it."""
+    server = HTTPServer(('127.0.0.1', 0), SlackStubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    os.environ['SLACK_WEBHOOK_URL'] = f"http://127.0.0.1:{server.server_port}/api/chat.postMessage"
+    return server
+
+@contextmanager
+def phase(timings, name):
+    """Records the wall time of a block under timings[name]."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[name] = timings.get(name, 0.0) + time.perf_counter() - started
+
+def bench_audience(conn, account_ids, mode):
+    timings = {}
+    with phase(timings, 'query'):
+        rows = audience_check_demo.collect(conn, account_ids, mode)
+    with phase(timings, 'formatting'):
+        messages = audience_check_demo.build_messages(rows)
+    with phase(timings, 'delivery'):
+        send_messages(messages)
+    return timings
+
+def bench_order_customer_sync(conn, account_ids, mode, workdir):
+    timings = {}
+    watermarks = {} if mode == 'incremental' else None
+    if mode == 'incremental':
+        # Seed the watermarks first so the timed run measures the steady-state incremental probe
+        order_customer_sync_demo.collect(conn, account_ids, watermarks)
+    with phase(timings, 'query'):
+        rows = order_customer_sync_demo.collect(conn, account_ids, watermarks)
+    with phase(timings, 'formatting'):
+        messages = order_customer_sync_demo.build_messages(rows)
+    with phase(timings, 'delivery'):
+        send_messages(messages)
+    return timings
+
+def bench_error_logging(conn, account_ids, mode, workdir):
+    timings = {}
+    combined = mode.startswith('combined')
+    sampling = 'min' if mode.endswith('min') else 'random'
+    with phase(timings, 'query'):
+        rows = error_logging_demo.collect(account_ids, conn, combined=combined, sampling=sampling)
+    writer = SheetWriter(CsvSheet(os.path.join(workdir, f"errors-{mode}.csv")), flush_rows=10 ** 9)
+    with phase(timings, 'formatting'):
+        for account_id, display_name, errors in rows:
+            error_logging_demo.insert_into_sheet(writer, account_id, display_name, errors)
+    with phase(timings, 'delivery'):
+        writer.flush()
+        send_to_slack(f"Daily Error Logging sheet updated:\n{writer.url}")
+    return timings
+
+SCENARIOS = {
+    'audience:set': lambda conn, ids, workdir: bench_audience(conn, ids, 'set'),
+    'audience:loop': lambda conn, ids, workdir: bench_audience(conn, ids, 'loop'),
+    'audience:rollup': lambda conn, ids, workdir: bench_audience(conn, ids, 'rollup'),
+    'order_customer_sync:full': lambda conn, ids, workdir: bench_order_customer_sync(conn, ids, 'full', workdir),
+    'order_customer_sync:incremental': lambda conn, ids, workdir: bench_order_customer_sync(conn, ids, 'incremental', workdir),
+    'error_logging:serial': lambda conn, ids, workdir: bench_error_logging(conn, ids, 'serial', workdir),
+    'error_logging:serial-min': lambda conn, ids, workdir: bench_error_logging(conn, ids, 'serial-min', workdir),
+    'error_logging:combined': lambda conn, ids, workdir: bench_error_logging(conn, ids, 'combined', workdir),
+    'error_logging:combined-min': lambda conn, ids, workdir: bench_error_logging(conn, ids, 'combined-min', workdir),
+}
+
+def main():
+    parser = argparse.ArgumentParser(description="Times each report end to end and per phase against the synthetic database.")
+    parser.add_argument('--dsn', default=os.getenv('BENCH_DSN'), required=not os.getenv('BENCH_DSN'),
+                        help="Benchmark database DSN (default: BENCH_DSN), loaded with benchmarks/generate_data.py")
+    parser.add_argument('--scenario', action='append', choices=sorted(SCENARIOS),
+                        help="Scenario to run; repeat for several (default: all)")
+    parser.add_argument('--repeat', type=int, default=3, help="Runs per scenario; the fastest is reported")
+    parser.add_argument('--output', default='bench_results.json', help="JSON file the results are written to")
+    args = parser.parse_args()
+
+    start_slack_stub()
+    conn = psycopg2.connect(args.dsn)
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT id FROM pf.account ORDER BY id;")
+            account_ids = [row[0] for row in cursor.fetchall()]
+            cursor.execute("SELECT version();")
+            server_version = cursor.fetchone()[0]
+        conn.rollback()
+
+        results = []
+        with tempfile.TemporaryDirectory(prefix='report-bench-') as workdir:
+            for name in args.scenario or SCENARIOS:
+                runs = []
+                for _ in range(args.repeat):
+                    timings = SCENARIOS[name](conn, account_ids, workdir)
+                    timings['total'] = sum(timings.values())
+                    runs.append(timings)
+                best = min(runs, key=lambda timings: timings['total'])
+                results.append({'scenario': name, 'accounts': len(account_ids), 'runs': len(runs), 'best': best})
+                print(f"{name:<34} total {best['total']:.3f}s  " +
+                      "  ".join(f"{key} {value:.3f}s" for key, value in best.items() if key != 'total'))
+    finally:
+        conn.close()
+
+    with open(args.output, 'w') as f:
+        json.dump({
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'server_version': server_version,
+            'results': results,
+        }, f, indent=2)
+    print(f"Results written to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+-- Minimal stand-in for the production pf schema used by the report scripts.
+-- Only the columns the reports read are modelled.
+
+CREATE SCHEMA IF NOT EXISTS pf;
+
+CREATE TABLE IF NOT EXISTS pf.account (
+    id BIGINT PRIMARY KEY,
+    display_name TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS pf.audiences (
+    id BIGSERIAL PRIMARY KEY,
+    account_id BIGINT NOT NULL,
+    slug TEXT NOT NULL,
+    is_used BOOLEAN NOT NULL DEFAULT false,
+    deleted_at TIMESTAMP,
+    updated_at TIMESTAMP NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS pf.email_queue_id_status (
+    account_id BIGINT NOT NULL,
+    status TEXT NOT NULL,
+    status_update_at TIMESTAMPTZ NOT NULL,
+    errors JSONB
+);
+
+CREATE TABLE IF NOT EXISTS pf.whatsapp_wamid_status (
+    account_id BIGINT NOT NULL,
+    status TEXT NOT NULL,
+    status_update_at TIMESTAMPTZ NOT NULL,
+    errors JSONB
+);
+
+CREATE TABLE IF NOT EXISTS pf.sms_queue_id_status (
+    account_id BIGINT NOT NULL,
+    status TEXT NOT NULL,
+    status_update_at TIMESTAMPTZ NOT NULL,
+    errors JSONB
+);
+
+CREATE TABLE IF NOT EXISTS pf.wh_ecom_order (
+    account_id BIGINT NOT NULL,
+    order_date TIMESTAMP NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS pf.wh_customer (
+    account_id BIGINT NOT NULL,
+    cust_created_at TIMESTAMP NOT NULL
+);
+
+-- Production set_account switches the tenant context; here it only records the account
+CREATE OR REPLACE FUNCTION set_account(account BIGINT) RETURNS VOID AS $$
+BEGIN
+    PERFORM set_config('app.account_id', account::TEXT, false);
+END;
+$$ LANGUAGE plpgsql;
@@ -0,0 +1,91 @@
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import subprocess
+from datetime import datetime, timezone
+
+# Measures what each entry point costs before it does any work: the cumulative import time
+# reported by `python -X importtime`, and the wall time of `<script> --help`.
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ENTRY_POINTS = [
+    'audience_check_demo',
+    'error_logging_demo',
+    'order_customer_sync_demo',
+    'combined_report',
+    'audience_rollup',
+    'report_daemon',
+    'shard_runner',
+    'query_plans',
+    'index_advisor',
+]
+# Heavy optional dependencies that must not be imported just by loading an entry point
+DEFERRED = ['gspread', 'oauth2client', 'requests', 'psycopg2', 'psycopg', 'psycopg_pool', 'numpy', 'pyarrow']
+
+def import_profile(module):
+    """Imports the module in a fresh interpreter and returns (cumulative import ms, modules imported)."""
+    completed = subprocess.run([sys.executable, '-X', 'importtime', '-c', f"import {module}"],
+                               cwd=ROOT, capture_output=True, text=True, check=True)
+    cumulative_us = None
+    imported = set()
+    for line in completed.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith('import time:') or '|' not in line:
+            continue
+        _, cumulative, name = (part.strip() for part in line[len('import time:'):].split('|'))
+        if not cumulative.isdigit():
+            continue  # Header line
+        imported.add(name.split('.')[0])
+        if name == module:
+            cumulative_us = int(cumulative)
+    return cumulative_us / 1000, imported
+
+def help_time(module):
+    """Returns the wall time in ms of running the entry point with --help."""
+    started = time.perf_counter()
+    subprocess.run([sys.executable, os.path.join(ROOT, f"{module}.py"), '--help'],
+                   cwd=ROOT, capture_output=True, check=True)
+    return (time.perf_counter() - started) * 1000
+
+def interpreter_time():
+    """Returns the wall time in ms of starting and stopping the interpreter, for reference."""
+    started = time.perf_counter()
+    subprocess.run([sys.executable, '-c', 'pass'], capture_output=True, check=True)
+    return (time.perf_counter() - started) * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description="Records import and --help times of every report entry point.")
+    parser.add_argument('--repeat', type=int, default=5, help="Runs per entry point; the fastest is reported")
+    parser.add_argument('--output', default='startup_times.json', help="JSON file the results are written to")
+    parser.add_argument('--max-import-ms', type=float, default=None,
+                        help="Exit with status 1 when an entry point's import time exceeds this budget")
+    args = parser.parse_args()
+
+    interpreter_ms = min(interpreter_time() for _ in range(args.repeat))
+    results = []
+    failed = False
+    for module in ENTRY_POINTS:
+        import_ms, imported = min((import_profile(module) for _ in range(args.repeat)), key=lambda profile: profile[0])
+        help_ms = min(help_time(module) for _ in range(args.repeat))
+        eager = sorted(imported & set(DEFERRED))
+        results.append({'entry_point': module, 'import_ms': round(import_ms, 2), 'help_ms': round(help_ms, 2),
+                        'help_ms_over_interpreter': round(help_ms - interpreter_ms, 2), 'eager_imports': eager})
+        over_budget = args.max_import_ms is not None and import_ms > args.max_import_ms
+        failed = failed or over_budget or bool(eager)
+        print(f"{module:<26} import {import_ms:8.2f}ms  --help {help_ms:8.2f}ms" +
+              (f"  eager: {', '.join(eager)}" if eager else "") + ("  OVER BUDGET" if over_budget else ""))
+
+    with open(args.output, 'w') as f:
+        json.dump({
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'interpreter_ms': round(interpreter_ms, 2),
+            'results': results,
+        }, f, indent=2)
+    print(f"Results written to {args.output}")
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+import argparse
+from dotenv import load_dotenv
+
+import metrics
+import audience_check_demo
+import error_logging_demo
+import order_customer_sync_demo
+from db import connect_db, set_account
+from display_names import get_display_names
+from fixtures import add_fixture_arguments, start_fixtures, stop_fixtures
+from metrics import timer, log_event
+from roster import add_roster_arguments, resolve_accounts
+from sheet_writer import DEFAULT_FLUSH_ROWS
+from watermarks import load_watermarks, save_watermarks
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Produces the audience, order/customer sync and error logging reports from one pass over the
+# roster: one connection, one display-name lookup and one set_account per account, followed by
+# all of that account's report queries.
+
+def account_name(display_names, account_id):
+    """Returns the account's display name, 'N/A' when it is NULL, or None for accounts missing from pf.account."""
+    if account_id not in display_names:
+        return None
+    return display_names[account_id] or 'N/A'
+
+def collect_account(cursor, account_id, display_name, watermarks, full_refresh=False, sampling='random'):
+    """Sets the account context once and runs every report's queries for the account.
+
+    Returns (audience row, sync row, errors); the first two are None for accounts missing from pf.account.
+    """
+    set_account(cursor, account_id)
+    errors = error_logging_demo.fetch_errors(cursor, account_id, sampling)
+    if display_name is None:
+        return None, None, errors
+    audience_row = (display_name, account_id) + audience_check_demo.fetch_account_summary(cursor, account_id)
+    sync_row = order_customer_sync_demo.fetch_account_sync(cursor, display_name, account_id, watermarks, full_refresh)
+    return audience_row, sync_row, errors
+
+def collect(conn, account_ids, watermarks=None, full_refresh=False, sampling='random'):
+    """Collects the typed rows of all three reports, in roster order.
+
+    Returns (audience rows, sync rows, error rows) in the shapes each report's deliver() takes.
+    """
+    if watermarks is None:
+        watermarks = {}
+    audience_rows, sync_rows, error_rows = [], [], []
+    with conn:
+        with conn.cursor() as cursor:
+            display_names = get_display_names(cursor, account_ids)
+            for account_id in account_ids:
+                display_name = account_name(display_names, account_id)
+                with timer('account', account=account_id):
+                    audience_row, sync_row, errors = collect_account(cursor, account_id, display_name,
+                                                                     watermarks, full_refresh, sampling)
+                if audience_row is not None:
+                    audience_rows.append(audience_row)
+                    sync_rows.append(sync_row)
+                error_rows.append((account_id, display_name or 'N/A', errors))
+    log_event('collected', accounts=len(account_ids))
+    return audience_rows, sync_rows, error_rows
+
+def collect_pipelined(conn, account_ids, watermarks=None, full_refresh=False, sampling='random', batch_accounts=None):
+    """Same as collect(), but sends each batch of accounts' statements in one libpq pipeline.
+
+    conn must be a psycopg 3 connection (pipeline.connect()).
+    """
+    import pipeline
+
+    if watermarks is None:
+        watermarks = {}
+    with conn.cursor() as cursor:
+        display_names = get_display_names(cursor, account_ids)
+
+    channels = list(error_logging_demo.channel_queries[sampling].items())
+    audience_rows, sync_rows, error_rows = [], [], []
+    for batch in pipeline.batched(account_ids, batch_accounts or pipeline.DEFAULT_BATCH_ACCOUNTS):
+        # Queue every account's statements in the order collect_account runs them
+        statements = []
+        for account_id in batch:
+            statements.append(("SELECT set_account(%s);", (account_id,)))
+            statements.extend((query, (account_id,)) for _, query in channels)
+            if account_id in display_names:
+                statements.append((audience_check_demo.account_summary_query, (account_id,)))
+                statements.append((order_customer_sync_demo.freshness_query,
+                                   order_customer_sync_demo.freshness_params(account_id, watermarks, full_refresh)))
+        results = iter(pipeline.execute_pipelined(conn, statements))
+
+        for account_id in batch:
+            next(results)  # set_account
+            errors = {channel: list(next(results)) for channel, _ in channels}
+            display_name = account_name(display_names, account_id)
+            if display_name is not None:
+                audience_rows.append((display_name, account_id) + tuple(next(results)[0]))
+                sync_rows.append(order_customer_sync_demo.sync_row(display_name, account_id, next(results)[0],
+                                                                   watermarks, full_refresh))
+            error_rows.append((account_id, display_name or 'N/A', errors))
+    conn.rollback()
+    log_event('collected', accounts=len(account_ids))
+    return audience_rows, sync_rows, error_rows
+
+def deliver(audience_rows, sync_rows, error_rows, flush_rows=DEFAULT_FLUSH_ROWS, dry_run=None):
+    """Delivers each report exactly as its own script would."""
+    with timer('deliver', target='audience'):
+        audience_check_demo.deliver(audience_rows)
+    with timer('deliver', target='order_customer_sync'):
+        order_customer_sync_demo.deliver(sync_rows)
+    with timer('deliver', target='error_logging'):
+        error_logging_demo.deliver(error_rows, flush_rows=flush_rows, dry_run=dry_run)
+
+def main():
+    parser = argparse.ArgumentParser(description="Runs the audience, order/customer sync and error logging reports in one pass over the roster.")
+    parser.add_argument('--watermarks', metavar='PATH', help="Watermark store for the sync report")
+    parser.add_argument('--full-refresh', action='store_true', help="Ignore stored watermarks for the sync report")
+    parser.add_argument('--sampling', choices=['random', 'min'], default='random',
+                        help="How error logging picks the representative message per error code")
+    parser.add_argument('--flush-rows', type=int, default=DEFAULT_FLUSH_ROWS, help="Maximum rows per Sheets write request")
+    parser.add_argument('--dry-run', metavar='CSV_PATH',
+                        help="Write the error sheet rows to a local CSV file and log its Slack message instead of posting it")
+    parser.add_argument('--pipeline', action='store_true',
+                        help="Send each batch of accounts' queries in one libpq pipeline (requires psycopg 3)")
+    parser.add_argument('--pipeline-batch', type=int, default=None, metavar='ACCOUNTS',
+                        help="With --pipeline, accounts per pipeline sync (default: PIPELINE_BATCH_ACCOUNTS or 50)")
+    add_roster_arguments(parser)
+    add_fixture_arguments(parser)
+    args = parser.parse_args()
+    if args.shard_output:
+        parser.error("--shard-output is not supported; shard each report with shard_runner.py")
+    if args.pipeline and (args.record or args.replay):
+        parser.error("--record and --replay don't support --pipeline")
+    metrics.set_report('combined')
+    start_fixtures(args)
+
+    conn = None
+    try:
+        if args.pipeline:
+            import pipeline
+            conn = pipeline.connect()
+        else:
+            conn = connect_db()
+        account_ids = resolve_accounts(args, conn)
+        watermarks = load_watermarks(args.watermarks) if args.watermarks else {}
+        with timer('collect', mode='pipeline' if args.pipeline else 'serial'):
+            if args.pipeline:
+                audience_rows, sync_rows, error_rows = collect_pipelined(conn, account_ids, watermarks, args.full_refresh,
+                                                                         args.sampling, args.pipeline_batch)
+            else:
+                audience_rows, sync_rows, error_rows = collect(conn, account_ids, watermarks, args.full_refresh, args.sampling)
+        deliver(audience_rows, sync_rows, error_rows, args.flush_rows, args.dry_run)
+
+        # Persist watermarks only after the reports went out
+        if args.watermarks:
+            save_watermarks(args.watermarks, order_customer_sync_demo.processed_watermarks(watermarks, sync_rows))
+    except Exception as e:
+        log_event('error', stage='report', error=str(e))
+    finally:
+        if conn:
+            conn.close()
+        stop_fixtures()
+        metrics.export()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+import os
+import threading
+from contextlib import contextmanager
+from dotenv import load_dotenv
+import fixtures
+from metrics import timer
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Database connection parameters
+DB_HOST = os.getenv('DB_HOST')  # Database host
+DB_NAME = os.getenv('DB_NAME')  # Database name
+DB_USER = os.getenv('DB_USER')  # Database user
+DB_PASS = os.getenv('DB_PASSWORD', os.getenv('DB_PASS'))  # Database password
+PORT = os.getenv('DB_PORT')     # Database port
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def connection_kwargs():
+    """Connection settings for psycopg 3, shared by the async and pipeline modes."""
+    settings = {'host': DB_HOST, 'dbname': DB_NAME, 'user': DB_USER, 'password': DB_PASS, 'port': PORT}
+    return {key: value for key, value in settings.items() if value}
+
+def _connect():
+    # The driver is imported on first connection so importing the reports stays cheap
+    import psycopg2
+
+    with timer('connect'):
+        return psycopg2.connect(host=DB_HOST, database=DB_NAME, user=DB_USER, password=DB_PASS, port=PORT)
+
+def _create_pool(max_connections):
+    from psycopg2.pool import ThreadedConnectionPool
+
+    return ThreadedConnectionPool(1, max_connections, host=DB_HOST, database=DB_NAME, user=DB_USER, password=DB_PASS, port=PORT)
+
+def connect_db():
+    """Establishes a connection to the PostgreSQL database, or to the active record/replay fixture."""
+    fixture = fixtures.active()
+    if fixture:
+        return fixture.connect(_connect)
+    return _connect()
+
+def create_pool(max_connections):
+    """Creates a thread-safe pool of up to max_connections database connections."""
+    fixture = fixtures.active()
+    if fixture:
+        return fixture.pool(max_connections, _create_pool)
+    return _create_pool(max_connections)
+
+def get_pool(max_connections=None):
+    """Returns the process-wide connection pool, creating it on first use."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = create_pool(max_connections or int(os.getenv('DB_POOL_SIZE', '8')))
+        return _pool
+
+def close_pool():
+    """Closes every connection in the process-wide pool."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.closeall()
+            _pool = None
+
+def set_account(cursor, account_id):
+    """Switches the cursor's session to the account's tenant context."""
+    with timer('set_account'):
+        cursor.execute("SELECT set_account(%s);", (account_id,))
+
+@contextmanager
+def pooled_connection(pool):
+    """Borrows a connection from the pool, discarding it if it was broken during use."""
+    with timer('pool_checkout'):
+        conn = pool.getconn()
+    try:
+        yield conn
+    finally:
+        if not conn.closed:
+            try:
+                conn.rollback()  # Leave no open transaction on a reused connection
+            except Exception:  # Broken beyond rollback; don't hand it out again
+                conn.close()
+        pool.putconn(conn, close=bool(conn.closed))
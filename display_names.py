@@ -0,0 +1,140 @@
+import os
+import json
+import time
+import fcntl
+import tempfile
+import threading
+from collections import OrderedDict
+from metrics import timer
+
+# Shared cache of pf.account display names. Entries live in an in-process LRU and, when
+# DISPLAY_NAME_CACHE_PATH is set, in a JSON file so later runs skip the lookup entirely.
+DEFAULT_TTL = int(os.getenv('DISPLAY_NAME_TTL', str(24 * 3600)))  # Seconds
+DEFAULT_MAX_ENTRIES = int(os.getenv('DISPLAY_NAME_CACHE_SIZE', '50000'))
+# Returned by lookup() for a miss, since a cached display name may be NULL
+MISSING = object()
+
+class DisplayNameCache:
+    """LRU cache of account display names with TTL and optional on-disk persistence."""
+
+    def __init__(self, ttl=DEFAULT_TTL, max_entries=DEFAULT_MAX_ENTRIES, path=None):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.path = path
+        self.entries = OrderedDict()  # account_id -> (display_name, fetched_at)
+        self.lock = threading.Lock()
+        if path:
+            self._load()
+
+    def _load(self):
+        self.entries.update(self._read())
+
+    def _read(self):
+        """Returns the unexpired entries stored in the cache file."""
+        if not os.path.exists(self.path):
+            return {}
+        with open(self.path) as f:
+            raw = json.load(f)
+        now = time.time()
+        return {
+            int(account_id): (display_name, fetched_at)
+            for account_id, (display_name, fetched_at) in raw.items()
+            if now - fetched_at < self.ttl
+        }
+
+    def save(self):
+        """Merges the cache into its file, if persistence is enabled.
+
+        Entries other processes saved meanwhile are kept (the newer lookup wins), so shards
+        can share one file.
+        """
+        if not self.path:
+            return
+        with open(f"{self.path}.lock", 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            merged = self._read()
+            with self.lock:
+                for account_id, entry in self.entries.items():
+                    if account_id not in merged or merged[account_id][1] <= entry[1]:
+                        merged[account_id] = entry
+            # Keep the most recently fetched entries
+            newest = sorted(merged.items(), key=lambda item: item[1][1])[-self.max_entries:]
+            raw = {str(account_id): entry for account_id, entry in newest}
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(self.path)),
+                                            prefix=f".{os.path.basename(self.path)}.", suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'w') as f:
+                    json.dump(raw, f)
+                os.replace(tmp_path, self.path)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+
+    def lookup(self, account_id, default=None):
+        """Returns the cached display name, or default when missing or expired.
+
+        Pass MISSING as default to tell a miss from a cached NULL name.
+        """
+        with self.lock:
+            entry = self.entries.get(account_id)
+            if entry is None:
+                return default
+            if time.time() - entry[1] >= self.ttl:
+                del self.entries[account_id]
+                return default
+            self.entries.move_to_end(account_id)
+            return entry[0]
+
+    def store(self, names):
+        """Adds {account_id: display_name} entries, evicting the least recently used."""
+        now = time.time()
+        with self.lock:
+            for account_id, display_name in names.items():
+                self.entries[account_id] = (display_name, now)
+                self.entries.move_to_end(account_id)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def get_many(self, cursor, account_ids):
+        """Returns {account_id: display_name}, fetching every cache miss in one query.
+
+        Accounts missing from pf.account are left out of the result.
+        """
+        names = {}
+        missing = []
+        for account_id in account_ids:
+            display_name = self.lookup(account_id, MISSING)
+            if display_name is MISSING:
+                missing.append(account_id)
+            else:
+                names[account_id] = display_name
+
+        if missing:
+            with timer('query', query='display_names'):
+                cursor.execute("SELECT id, display_name FROM pf.account WHERE id = ANY(%s);", (missing,))
+                fetched = dict(cursor.fetchall())
+            self.store(fetched)
+            self.save()
+            names.update(fetched)
+        return names
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_cache():
+    """Returns the process-wide cache, configured from the environment on first use."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = DisplayNameCache(path=os.getenv('DISPLAY_NAME_CACHE_PATH'))
+        return _cache
+
+def set_cache(cache):
+    """Replaces the process-wide cache, e.g. with one that isn't persisted."""
+    global _cache
+    with _cache_lock:
+        _cache = cache
+
+def get_display_names(cursor, account_ids):
+    """Returns display names for the accounts, using the shared cache."""
+    return get_cache().get_many(cursor, list(account_ids))
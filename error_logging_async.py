@@ -0,0 +1,118 @@
+import asyncio
+
+from psycopg_pool import AsyncConnectionPool
+
+import db
+from error_logging_demo import channel_queries, format_account_rows, open_sheet
+from notifier import send_to_slack
+from anomalies import find_anomalies, format_anomalies
+from metrics import timer, log_event
+from display_names import get_cache, MISSING
+from sheet_writer import SheetWriter, CsvSheet, DEFAULT_FLUSH_ROWS
+
+# asyncio execution mode for error_logging_demo: account queries run concurrently over an
+# async psycopg 3 pool, while the blocking gspread and Slack clients run in worker threads
+# so their latency overlaps with the database work.
+
+async def fetch_account(pool, semaphore, account_id, sampling='random'):
+    """Sets the account context and fetches the display name and channel errors."""
+    async with semaphore:
+        with timer('account', account=account_id):
+            async with pool.connection() as conn:
+                async with conn.cursor() as cursor:
+                    with timer('set_account'):
+                        await cursor.execute("SELECT set_account(%s);", (account_id,))
+                    display_name = get_cache().lookup(account_id) or 'N/A'
+
+                    errors = {'Email': [], 'WhatsApp': [], 'SMS': []}
+                    for channel, query in channel_queries[sampling].items():
+                        with timer('query', query=f"{channel.lower()}_{sampling}"):
+                            await cursor.execute(query, (account_id,))
+                            errors[channel].extend(await cursor.fetchall())
+    return display_name, errors
+
+async def prefetch_display_names(pool, account_ids):
+    """Fills the shared name cache with one query for every account it doesn't already hold."""
+    cache = get_cache()
+    missing = [account_id for account_id in account_ids if cache.lookup(account_id, MISSING) is MISSING]
+    if not missing:
+        return
+    async with pool.connection() as conn:
+        async with conn.cursor() as cursor:
+            with timer('query', query='display_names'):
+                await cursor.execute("SELECT id, display_name FROM pf.account WHERE id = ANY(%s);", (missing,))
+                cache.store(dict(await cursor.fetchall()))
+    cache.save()
+
+async def sheet_consumer(queue, writer):
+    """Appends queued account rows to the sheet writer in order, off the event loop."""
+    while True:
+        rows = await queue.get()
+        if rows is None:
+            break
+        await asyncio.to_thread(writer.append_rows, rows)
+    await asyncio.to_thread(writer.flush)
+
+async def put_rows(queue, consumer, rows):
+    """Queues rows for the sheet consumer, re-raising its exception if it died instead of waiting on a full queue."""
+    put = asyncio.ensure_future(queue.put(rows))
+    await asyncio.wait({put, consumer}, return_when=asyncio.FIRST_COMPLETED)
+    if consumer.done() and consumer.exception() is not None:
+        put.cancel()
+        consumer.result()
+
+async def run_async(account_ids, sampling='random', max_in_flight=10, flush_rows=DEFAULT_FLUSH_ROWS,
+                    dry_run=None, deliver=True):
+    """Collects errors for every account concurrently and streams them into the sheet in roster order.
+
+    At most max_in_flight accounts are queried at once. Returns (account_id, display_name, errors) rows.
+    """
+    pool = AsyncConnectionPool(kwargs=db.connection_kwargs(), min_size=1, max_size=max_in_flight, open=False)
+    await pool.open()
+    tasks = []
+    consumer = None
+    try:
+        await prefetch_display_names(pool, account_ids)
+        semaphore = asyncio.Semaphore(max_in_flight)
+        tasks = [asyncio.create_task(fetch_account(pool, semaphore, account_id, sampling)) for account_id in account_ids]
+
+        if deliver:
+            # Authorizing with Google overlaps with the first database queries
+            sheet = CsvSheet(dry_run) if dry_run else await asyncio.to_thread(open_sheet)
+            writer = SheetWriter(sheet, flush_rows=flush_rows)
+            queue = asyncio.Queue(maxsize=max_in_flight)
+            consumer = asyncio.create_task(sheet_consumer(queue, writer))
+
+        results = []
+        for account_id, task in zip(account_ids, tasks):
+            display_name, errors = await task
+            results.append((account_id, display_name, errors))
+            log_event('account_errors', account=account_id, display_name=display_name,
+                      **{channel.lower(): len(error_list) for channel, error_list in errors.items()})
+            if deliver:
+                with timer('format'):
+                    account_rows = format_account_rows(account_id, display_name, errors)
+                # Waits when the sheet writer falls behind, and fails the run if the writer failed
+                await put_rows(queue, consumer, account_rows)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        if consumer:
+            consumer.cancel()
+        raise
+    finally:
+        await pool.close()
+
+    if deliver:
+        await put_rows(queue, consumer, None)
+        await consumer
+        log_event('sheet_written', accounts=len(results), write_requests=writer.api_calls)
+
+        slack_message = f"Daily Error Logging sheet updated. Click the below link to review past 24 hours errors:\n{writer.url}"
+        # The caller records the run afterwards, so it isn't part of its own baseline
+        slack_message += format_anomalies(await asyncio.to_thread(find_anomalies, 'error_logging', results))
+        if dry_run:
+            log_event('slack_message', text=slack_message, dry_run=True)
+        else:
+            await asyncio.to_thread(send_to_slack, slack_message)
+    return results
@@ -1,39 +1,24 @@
-import psycopg2
-import gspread
-from oauth2client.service_account import ServiceAccountCredentials
-import requests
+import argparse
+import functools
+from concurrent.futures import ThreadPoolExecutor
 import os
 from dotenv import load_dotenv
+import metrics
+from db import connect_db, create_pool, pooled_connection, set_account
+from metrics import timer, log_event
+from notifier import send_to_slack
+from display_names import get_display_names
+from snapshots import record_snapshot
+from anomalies import find_anomalies, format_anomalies
+from sheet_writer import SheetWriter, CsvSheet, DEFAULT_FLUSH_ROWS
+from fixtures import active, add_fixture_arguments, start_fixtures, stop_fixtures
+from roster import add_roster_arguments, load_roster, resolve_accounts, write_shard_output
 
 # Load environment variables from .env file
 load_dotenv()
 
-# Database connection parameters
-DB_HOST = os.getenv('DB_HOST')  # Database host
-DB_NAME = os.getenv('DB_NAME')  # Database name
-DB_USER = os.getenv('DB_USER')  # Database user
-DB_PASS = os.getenv('DB_PASS')  # Database password
-PORT = os.getenv('DB_PORT')     # Database port
-
 # Google Sheets setup
 scope = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
-creds = ServiceAccountCredentials.from_json_keyfile_name(os.getenv('GOOGLE_CREDS_FILE'), scope)
-client = gspread.authorize(creds)
-
-# Access the Google Sheet
-sheet = client.open(os.getenv('GOOGLE_SHEET_NAME')).sheet1  # Ensure this is the correct sheet name
-sheet_url = sheet.url  # Get the URL of the Google Sheet
-
-# List of account IDs
-account_ids = [
-    221218718049371529,
-    318376149853931305,
-    189857344031557017,
-    308857572440410099,
-    196436990147692145,
-    353789014706227026,
-    328385381068178508
-]
 
 # SQL queries for fetching errors
 email_query = """
@@ -87,108 +72,559 @@ ORDER BY
     RANDOM();  -- Randomly select one message for each error code
 """
 
-# Slack Bot User OAuth Access Token
-slack_token = os.getenv('SLACK_BOT_TOKEN')  # Make sure to set this in your environment
-channel_id = os.getenv('SLACK_CHANNEL_ID')  # Your channel ID
+# Combined query returning all three channels for all accounts in one round trip
+combined_errors_query = """
+SELECT * FROM (
+    SELECT DISTINCT ON (account_id, errors->>'code')
+        'Email' AS Channel,
+        account_id,
+        errors->>'code' AS Error_Code,
+        errors->>'message' AS Error_Message,
+        COUNT(*) OVER (PARTITION BY account_id, errors->>'code') AS Error_Count
+    FROM
+        pf.email_queue_id_status
+    WHERE
+        account_id = ANY(%(account_ids)s)
+        AND status = 'failed'
+        AND status_update_at >= NOW() - INTERVAL '24 hours'
+    ORDER BY
+        account_id,
+        errors->>'code',
+        RANDOM()
+) email_errors
+UNION ALL
+SELECT * FROM (
+    SELECT DISTINCT ON (account_id, errors->>'code')
+        'WhatsApp' AS Channel,
+        account_id,
+        errors->>'code' AS Error_Code,
+        errors->>'message' AS Error_Message,
+        COUNT(*) OVER (PARTITION BY account_id, errors->>'code') AS Error_Count
+    FROM
+        pf.whatsapp_wamid_status
+    WHERE
+        account_id = ANY(%(account_ids)s)
+        AND status = 'failed'
+        AND status_update_at >= NOW() - INTERVAL '24 hours'
+        AND errors IS NOT NULL
+    ORDER BY
+        account_id,
+        errors->>'code',
+        RANDOM()
+) whatsapp_errors
+UNION ALL
+SELECT * FROM (
+    SELECT DISTINCT ON (account_id, errors->>'code')
+        'SMS' AS Channel,
+        account_id,
+        errors->>'code' AS Error_Code,
+        errors->>'error' AS Error_Message,
+        COUNT(*) OVER (PARTITION BY account_id, errors->>'code') AS Error_Count
+    FROM
+        pf.sms_queue_id_status
+    WHERE
+        account_id = ANY(%(account_ids)s)
+        AND status = 'failed'
+        AND status_update_at >= NOW() - INTERVAL '24 hours'
+    GROUP BY
+        account_id, errors->>'code', errors->>'error'
+    ORDER BY
+        account_id,
+        errors->>'code',
+        RANDOM()
+) sms_errors
+ORDER BY
+    account_id,
+    Error_Code;
+"""
+
+# Aggregate-based variants: one GROUP BY per error code picks MIN(message) as the
+# representative message, avoiding the full RANDOM() sort of every failed row
+email_query_min = """
+SELECT
+    errors->>'code' AS Error_Code,
+    MIN(errors->>'message') AS Error_Message,
+    COUNT(*) AS Error_Count
+FROM
+    pf.email_queue_id_status eqis
+WHERE
+    account_id = %s
+    AND status = 'failed'
+    AND status_update_at >= NOW() - INTERVAL '24 hours'
+GROUP BY
+    errors->>'code'
+ORDER BY
+    errors->>'code';
+"""
+
+whatsapp_query_min = """
+SELECT
+    errors->>'code' AS Error_Code,
+    MIN(errors->>'message') AS Error_Message,
+    COUNT(*) AS Error_Count
+FROM
+    pf.whatsapp_wamid_status wms
+WHERE
+    account_id = %s
+    AND status = 'failed'
+    AND status_update_at >= NOW() - INTERVAL '24 hours'
+    AND errors IS NOT NULL
+GROUP BY
+    errors->>'code'
+ORDER BY
+    errors->>'code';
+"""
+
+sms_query_min = """
+SELECT
+    errors->>'code' AS Error_Code,
+    MIN(errors->>'error') AS Error_Message,
+    COUNT(*) AS Error_Count
+FROM
+    pf.sms_queue_id_status
+WHERE
+    account_id = %s
+    AND status = 'failed'
+    AND status_update_at >= NOW() - INTERVAL '24 hours'
+GROUP BY
+    errors->>'code'
+ORDER BY
+    errors->>'code';
+"""
+
+combined_errors_query_min = """
+SELECT
+    'Email' AS Channel,
+    account_id,
+    errors->>'code' AS Error_Code,
+    MIN(errors->>'message') AS Error_Message,
+    COUNT(*) AS Error_Count
+FROM
+    pf.email_queue_id_status
+WHERE
+    account_id = ANY(%(account_ids)s)
+    AND status = 'failed'
+    AND status_update_at >= NOW() - INTERVAL '24 hours'
+GROUP BY
+    account_id, errors->>'code'
+UNION ALL
+SELECT
+    'WhatsApp' AS Channel,
+    account_id,
+    errors->>'code' AS Error_Code,
+    MIN(errors->>'message') AS Error_Message,
+    COUNT(*) AS Error_Count
+FROM
+    pf.whatsapp_wamid_status
+WHERE
+    account_id = ANY(%(account_ids)s)
+    AND status = 'failed'
+    AND status_update_at >= NOW() - INTERVAL '24 hours'
+    AND errors IS NOT NULL
+GROUP BY
+    account_id, errors->>'code'
+UNION ALL
+SELECT
+    'SMS' AS Channel,
+    account_id,
+    errors->>'code' AS Error_Code,
+    MIN(errors->>'error') AS Error_Message,
+    COUNT(*) AS Error_Count
+FROM
+    pf.sms_queue_id_status
+WHERE
+    account_id = ANY(%(account_ids)s)
+    AND status = 'failed'
+    AND status_update_at >= NOW() - INTERVAL '24 hours'
+GROUP BY
+    account_id, errors->>'code'
+ORDER BY
+    account_id,
+    Error_Code;
+"""
+
+# Queries per sampling strategy: 'random' picks a random message per code, 'min' the smallest one
+channel_queries = {
+    'random': {'Email': email_query, 'WhatsApp': whatsapp_query, 'SMS': sms_query},
+    'min': {'Email': email_query_min, 'WhatsApp': whatsapp_query_min, 'SMS': sms_query_min},
+}
+combined_queries = {
+    'random': combined_errors_query,
+    'min': combined_errors_query_min,
+}
+
+
+@functools.lru_cache(maxsize=None)
+def open_sheet():
+    """Authorizes with Google and opens the error logging worksheet, once per process."""
+    fixture = active()
+    if fixture:
+        return fixture.sheet(open_live_sheet)
+    return open_live_sheet()
 
-def connect_db():
-    """Establishes a connection to the PostgreSQL database."""
-    return psycopg2.connect(host=DB_HOST, database=DB_NAME, user=DB_USER, password=DB_PASS, port=PORT)
+def open_live_sheet():
+    """Authorizes with Google and opens the error logging worksheet."""
+    # Imported here so --help, dry runs and other tools importing this module don't pay for them
+    import gspread
+    from oauth2client.service_account import ServiceAccountCredentials
+
+    creds = ServiceAccountCredentials.from_json_keyfile_name(os.getenv('GOOGLE_CREDS_FILE'), scope)
+    client = gspread.authorize(creds)
+    return client.open(os.getenv('GOOGLE_SHEET_NAME')).sheet1  # Ensure this is the correct sheet name
 
 def fetch_display_name(cursor, account_id):
-    """Fetches the display name for the given account ID."""
-    cursor.execute("SELECT display_name FROM pf.account WHERE id = %s;", (account_id,))
-    return cursor.fetchone()
+    """Fetches the display name for the given account ID, or None if the account doesn't exist."""
+    return get_display_names(cursor, [account_id]).get(account_id)
+
+def fetch_display_names(cursor, account_ids):
+    """Fetches the display names for all given account IDs, querying only cache misses in one round trip."""
+    return get_display_names(cursor, account_ids)
 
-def fetch_errors(cursor, account_id):
+def fetch_errors(cursor, account_id, sampling='random'):
     """Fetches errors for Email, WhatsApp, and SMS channels."""
     errors = {'Email': [], 'WhatsApp': [], 'SMS': []}
 
-    # Email Errors
-    cursor.execute(email_query, (account_id,))
-    for row in cursor.fetchall():
-        errors['Email'].append(row)
+    for channel, query in channel_queries[sampling].items():
+        with timer('query', query=f"{channel.lower()}_{sampling}"):
+            cursor.execute(query, (account_id,))
+            rows = cursor.fetchall()
+        for row in rows:
+            errors[channel].append(row)
+
+    return errors
+
+def fetch_errors_bulk(cursor, account_ids, sampling='random'):
+    """Fetches Email, WhatsApp, and SMS errors for all accounts in a single statement.
 
-    # WhatsApp Errors
-    cursor.execute(whatsapp_query, (account_id,))
-    for row in cursor.fetchall():
-        errors['WhatsApp'].append(row)
+    Returns a dict keyed by account ID holding the same per-channel structure as fetch_errors.
+    """
+    errors = {account_id: {'Email': [], 'WhatsApp': [], 'SMS': []} for account_id in account_ids}
 
-    # SMS Errors
-    cursor.execute(sms_query, (account_id,))
-    for row in cursor.fetchall():
-        errors['SMS'].append(row)
+    with timer('query', query=f"combined_{sampling}"):
+        cursor.execute(combined_queries[sampling], {'account_ids': list(account_ids)})
+        rows = cursor.fetchall()
+    for channel, account_id, error_code, error_message, error_count in rows:
+        errors[account_id][channel].append((error_code, error_message, error_count))
 
     return errors
 
-def insert_into_sheet(account_id, display_name, errors):
-    """Inserts error data into the Google Sheet in batches to reduce API requests."""
-    data_to_write = []  # Collect all data to write in a single batch
+def explain_cost(cursor, query, params):
+    """Returns the planner's estimated total cost for a query."""
+    cursor.execute("EXPLAIN (FORMAT JSON) " + query, params)
+    plan = cursor.fetchone()[0]
+    return plan[0]['Plan']['Total Cost']
+
+def compare_sampling_costs(cursor, account_ids):
+    """Prints the planner cost of each channel query under both sampling strategies."""
+    print("| Account ID          | Channel  | random cost  | min cost     | Ratio  |")
+    print("|---------------------|----------|--------------|--------------|--------|")
+    for account_id in account_ids:
+        set_account(cursor, account_id)
+        for channel in channel_queries['random']:
+            random_cost = explain_cost(cursor, channel_queries['random'][channel], (account_id,))
+            min_cost = explain_cost(cursor, channel_queries['min'][channel], (account_id,))
+            ratio = random_cost / min_cost if min_cost else float('nan')
+            print(f"| {account_id:<19} | {channel:<8} | {random_cost:<12.2f} | {min_cost:<12.2f} | {ratio:<6.2f} |")
 
+    combined_random = explain_cost(cursor, combined_queries['random'], {'account_ids': list(account_ids)})
+    combined_min = explain_cost(cursor, combined_queries['min'], {'account_ids': list(account_ids)})
+    print(f"\nCombined query cost: random={combined_random:.2f}, min={combined_min:.2f}")
+
+def iter_account_rows(account_id, display_name, errors):
+    """Yields the sheet rows for one account's errors.
+
+    The per-channel error lists may be lazy iterables, such as streaming cursors.
+    """
     # Add account header
-    data_to_write.append([f"Account ID: {account_id}", f"Display Name: {display_name}"])
-    
+    yield [f"Account ID: {account_id}", f"Display Name: {display_name}"]
+
     # Add errors for each channel
     for channel, error_list in errors.items():
-        data_to_write.append([f"{channel} Errors:"])  # Channel header
-        if error_list:
-            for error in error_list:
-                data_to_write.append([error[0], error[1], error[2]])  # Error Code, Error Message, Count
+        yield [f"{channel} Errors:"]  # Channel header
+        found = False
+        for error in error_list:
+            found = True
+            yield [error[0], error[1], error[2]]  # Error Code, Error Message, Count
+        if not found:
+            yield ["No errors found."]  # No errors message
+
+def format_account_rows(account_id, display_name, errors):
+    """Builds the sheet rows for one account's errors."""
+    return list(iter_account_rows(account_id, display_name, errors))
+
+def insert_into_sheet(writer, account_id, display_name, errors):
+    """Queues error data for the account on the buffered sheet writer."""
+    # Buffered; written to the sheet when the writer flushes
+    writer.append_rows(iter_account_rows(account_id, display_name, errors))
+
+def collect_account(cursor, account_id, sampling='random'):
+    """Sets the account context and fetches the display name and channel errors."""
+    with timer('account', account=account_id):
+        set_account(cursor, account_id)
+        display_name = fetch_display_name(cursor, account_id) or 'N/A'
+        errors = fetch_errors(cursor, account_id, sampling)
+    return display_name, errors
+
+def collect_serial(conn, account_ids, sampling='random'):
+    """Collects errors for each account one after another on a single cursor."""
+    with conn.cursor() as cursor:
+        fetch_display_names(cursor, account_ids)  # Warm the name cache in one query
+        return [collect_account(cursor, account_id, sampling) for account_id in account_ids]
+
+def collect_combined(conn, account_ids, sampling='random'):
+    """Collects display names and errors for all accounts in two round trips."""
+    with conn.cursor() as cursor:
+        display_names = fetch_display_names(cursor, account_ids)
+        errors = fetch_errors_bulk(cursor, account_ids, sampling)
+    return [(display_names.get(account_id) or 'N/A', errors[account_id]) for account_id in account_ids]
+
+def collect_concurrent(pool, account_ids, max_workers, sampling='random'):
+    """Collects errors for the accounts over a bounded pool of worker connections.
+
+    Results are returned in the same order as account_ids.
+    """
+    def worker(account_id):
+        with pooled_connection(pool) as conn:
+            with conn.cursor() as cursor:
+                return collect_account(cursor, account_id, sampling)
+
+    # Warm the name cache in one query so workers don't look names up one by one
+    with pooled_connection(pool) as conn:
+        with conn.cursor() as cursor:
+            fetch_display_names(cursor, account_ids)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(worker, account_ids))
+
+def collect(account_ids, conn=None, pool=None, combined=False, max_workers=1, sampling='random'):
+    """Collects (account_id, display_name, errors) for every account, in roster order.
+
+    Uses conn for serial and combined collection, or pool when max_workers > 1.
+    """
+    mode = 'combined' if combined else 'concurrent' if max_workers > 1 else 'serial'
+    with timer('collect', mode=mode):
+        if combined:
+            results = collect_combined(conn, account_ids, sampling)
+        elif max_workers > 1:
+            results = collect_concurrent(pool, account_ids, max_workers, sampling)
+        else:
+            results = collect_serial(conn, account_ids, sampling)
+    if conn:
+        conn.rollback()  # End the read transaction before the slow Sheets/Slack calls
+    return [(account_id, display_name, errors) for account_id, (display_name, errors) in zip(account_ids, results)]
+
+def deliver(rows, sheet=None, flush_rows=DEFAULT_FLUSH_ROWS, dry_run=None):
+    """Records the collected errors, writes them to the sheet and posts the Slack notice."""
+    # Scored before recording, so the run isn't part of its own baseline
+    anomalies = find_anomalies('error_logging', rows)
+    record_snapshot('error_logging', rows)
+
+    if sheet is None:
+        sheet = CsvSheet(dry_run) if dry_run else open_sheet()
+    writer = SheetWriter(sheet, flush_rows=flush_rows)
+
+    for account_id, display_name, errors in rows:
+        # Log the error counts for debugging
+        log_event('account_errors', account=account_id, display_name=display_name,
+                  **{channel.lower(): len(error_list) for channel, error_list in errors.items()})
+
+        with timer('format'):
+            insert_into_sheet(writer, account_id, display_name, errors)  # Queue errors for the Google Sheet
+
+    finish_delivery(writer, len(rows), dry_run, anomalies)
+
+def finish_delivery(writer, account_count, dry_run=None, anomalies=None):
+    """Flushes the remaining sheet rows and posts the Slack notice, listing any anomalies."""
+    writer.flush()
+    log_event('sheet_written', accounts=account_count, write_requests=writer.api_calls)
+
+    # Send Slack message with the Google Sheet link
+    slack_message = f"Daily Error Logging sheet updated. Click the below link to review past 24 hours errors:\n{writer.url}"
+    slack_message += format_anomalies(anomalies or [])
+    if dry_run:
+        log_event('slack_message', text=slack_message, dry_run=True)
+    else:
+        send_to_slack(slack_message)
+
+def stream_channel_errors(conn, query, account_id, itersize):
+    """Yields one channel's error rows from a named server-side cursor, itersize rows per round trip."""
+    with conn.cursor(name=f"channel_errors_{account_id}") as cursor:
+        cursor.itersize = itersize
+        cursor.execute(query, (account_id,))
+        for row in cursor:
+            yield row
+
+def run_streaming(conn, account_ids, sampling='random', itersize=2000, sheet=None,
+                  flush_rows=DEFAULT_FLUSH_ROWS, dry_run=None):
+    """Streams each account's errors from server-side cursors straight into the sheet writer.
+
+    Peak memory is bounded by itersize and flush_rows rather than by the size of the result.
+    """
+    if sheet is None:
+        sheet = CsvSheet(dry_run) if dry_run else open_sheet()
+    writer = SheetWriter(sheet, flush_rows=flush_rows)
+
+    with conn.cursor() as cursor:
+        fetch_display_names(cursor, account_ids)  # Warm the name cache in one query
+
+    for account_id in account_ids:
+        # Streaming interleaves the queries with the sheet writes, so the account is timed as a whole
+        with timer('account', account=account_id):
+            with conn.cursor() as cursor:
+                set_account(cursor, account_id)
+                display_name = fetch_display_name(cursor, account_id) or 'N/A'
+            log_event('account_started', account=account_id, display_name=display_name)
+
+            # Channels are consumed in order, so only one server-side cursor is open at a time
+            errors = {
+                channel: stream_channel_errors(conn, query, account_id, itersize)
+                for channel, query in channel_queries[sampling].items()
+            }
+            insert_into_sheet(writer, account_id, display_name, errors)
+            conn.commit()  # Release the account's cursors and snapshot
+
+    finish_delivery(writer, len(account_ids), dry_run)
+
+def run(conn=None, pool=None, sheet=None, combined=False, max_workers=1, sampling='random',
+        flush_rows=DEFAULT_FLUSH_ROWS, dry_run=None, account_ids=None):
+    """Collects errors for every account, writes them to the sheet and posts the Slack notice."""
+    rows = collect(load_roster() if account_ids is None else account_ids, conn, pool, combined, max_workers, sampling)
+    deliver(rows, sheet, flush_rows, dry_run)
+    return rows
+
+def main_pipeline(args):
+    """Runs the pipelined collection; psycopg 3 is imported only when requested."""
+    import pipeline
+
+    try:
+        conn = pipeline.connect()
+        try:
+            account_ids = resolve_accounts(args, conn)
+            with timer('collect', mode='pipeline'):
+                results = pipeline.collect_errors(conn, account_ids, args.sampling,
+                                                  args.pipeline_batch or pipeline.DEFAULT_BATCH_ACCOUNTS)
+        finally:
+            conn.close()
+
+        rows = [(account_id, display_name, errors) for account_id, (display_name, errors) in zip(account_ids, results)]
+        if args.shard_output:
+            write_shard_output(args.shard_output, 'error_logging', rows)
+        else:
+            deliver(rows, flush_rows=args.flush_rows, dry_run=args.dry_run)
+    except Exception as e:
+        log_event('error', stage='report', error=str(e))
+    finally:
+        metrics.export()
+
+def main_async(args):
+    """Runs the asyncio execution mode; its driver is imported only when requested."""
+    import asyncio
+    from error_logging_async import run_async
+
+    try:
+        conn = connect_db() if args.roster == 'db' else None
+        try:
+            account_ids = resolve_accounts(args, conn)
+        finally:
+            if conn:
+                conn.close()
+
+        rows = asyncio.run(run_async(account_ids, args.sampling, args.max_in_flight, args.flush_rows,
+                                     args.dry_run, deliver=not args.shard_output))
+        if args.shard_output:
+            write_shard_output(args.shard_output, 'error_logging', rows)
         else:
-            data_to_write.append(["No errors found."])  # No errors message
-
-    # Write all data in one batch
-    sheet.append_rows(data_to_write, value_input_option='RAW')
-
-def send_to_slack(message):
-    """Sends a message to a Slack channel."""
-    url = os.getenv('SLACK_WEBHOOK_URL')  # Slack webhook URL
-    headers = {
-        'Content-Type': 'application/json'
-    }
-    payload = {
-        'channel': channel_id,
-        'text': message,
-        'mrkdwn': True
-    }
-    response = requests.post(url, headers=headers, json=payload)
-    print(response.text)  # Print the full response for debugging
-    if not response.ok or not response.json().get('ok'):
-        raise ValueError(f'Request to Slack returned an error: {response.text}')
+            record_snapshot('error_logging', rows)
+    except Exception as e:
+        log_event('error', stage='report', error=str(e))
+    finally:
+        metrics.export()
 
 def main():
     """Main function to run the error fetching process."""
-    try:
-        conn = connect_db()
-        cursor = conn.cursor()
+    parser = argparse.ArgumentParser(description="Daily channel error logging to Google Sheets.")
+    parser.add_argument('--max-workers', type=int, default=1,
+                        help="Number of accounts to query concurrently, each on its own connection (default: 1, serial)")
+    parser.add_argument('--combined', action='store_true',
+                        help="Fetch all channels for all accounts in one statement instead of per-account queries; "
+                             "runs without set_account, so it needs a database role that sees every account's rows")
+    parser.add_argument('--sampling', choices=['random', 'min'], default='random',
+                        help="How to pick the representative message per error code: 'random' sorts every failed row, 'min' aggregates without sorting")
+    parser.add_argument('--compare-sampling', action='store_true',
+                        help="Print the planner cost of both sampling strategies for each account and exit")
+    parser.add_argument('--flush-rows', type=int, default=DEFAULT_FLUSH_ROWS,
+                        help="Maximum rows per Sheets write request")
+    parser.add_argument('--dry-run', metavar='CSV_PATH',
+                        help="Write sheet rows to a local CSV file and print the Slack message instead of posting it")
+    parser.add_argument('--async', dest='use_async', action='store_true',
+                        help="Run account queries, Sheets writes and the Slack post concurrently on asyncio (requires psycopg 3 and psycopg_pool)")
+    parser.add_argument('--max-in-flight', type=int, default=10,
+                        help="With --async, maximum accounts being queried at once")
+    parser.add_argument('--stream', action='store_true',
+                        help="Stream channel errors from server-side cursors straight into the sheet, keeping memory flat")
+    parser.add_argument('--itersize', type=int, default=2000,
+                        help="With --stream, rows fetched per server-side cursor round trip")
+    parser.add_argument('--pipeline', action='store_true',
+                        help="Send each batch of accounts' queries in one libpq pipeline, about one round trip per batch (requires psycopg 3)")
+    parser.add_argument('--pipeline-batch', type=int, default=None, metavar='ACCOUNTS',
+                        help="With --pipeline, accounts per pipeline sync (default: PIPELINE_BATCH_ACCOUNTS or 50)")
+    add_roster_arguments(parser)
+    add_fixture_arguments(parser)
+    args = parser.parse_args()
+    if args.stream and args.shard_output:
+        parser.error("--stream writes the sheet as it goes and doesn't support --shard-output")
+    metrics.set_report('error_logging')
+
+    if args.use_async or args.pipeline:
+        if args.record or args.replay:
+            parser.error("--record and --replay don't support --async or --pipeline")
+        if args.use_async:
+            main_async(args)
+        else:
+            main_pipeline(args)
+        return
 
-        for account_id in account_ids:
-            # Set the account context
-            cursor.execute("SELECT set_account(%s);", (account_id,))
-            display_name = fetch_display_name(cursor, account_id)
-            display_name = display_name[0] if display_name else 'N/A'
+    start_fixtures(args)
 
-            errors = fetch_errors(cursor, account_id)
+    conn = None
+    pool = None
+    try:
+        if args.max_workers > 1 and not (args.combined or args.compare_sampling or args.stream):
+            pool = create_pool(args.max_workers)
+        else:
+            conn = connect_db()
+
+        if args.roster == 'db' and conn is None:
+            with pooled_connection(pool) as roster_conn:
+                account_ids = resolve_accounts(args, roster_conn)
+        else:
+            account_ids = resolve_accounts(args, conn)
 
-            # Log the errors for debugging
-            print(f"\nAccount ID: {account_id}, Display Name: {display_name}")
-            print(f"Email Errors: {errors['Email']}")
-            print(f"WhatsApp Errors: {errors['WhatsApp']}")
-            print(f"SMS Errors: {errors['SMS']}")
+        if args.compare_sampling:
+            with conn.cursor() as cursor:
+                compare_sampling_costs(cursor, account_ids)
+            return
 
-            insert_into_sheet(account_id, display_name, errors)  # Insert errors into Google Sheet
+        if args.stream:
+            run_streaming(conn, account_ids, args.sampling, args.itersize,
+                          flush_rows=args.flush_rows, dry_run=args.dry_run)
+            return
 
-        # Send Slack message with the Google Sheet link
-        slack_message = f"Daily Error Logging sheet updated. Click the below link to review past 24 hours errors:\n{sheet_url}"
-        send_to_slack(slack_message)
+        rows = collect(account_ids, conn, pool, args.combined, args.max_workers, args.sampling)
+        if args.shard_output:
+            write_shard_output(args.shard_output, 'error_logging', rows)
+        else:
+            deliver(rows, flush_rows=args.flush_rows, dry_run=args.dry_run)
 
     except Exception as e:
-        print(f"An error occurred: {e}")
+        log_event('error', stage='report', error=str(e))
     finally:
-        if cursor:
-            cursor.close()
-        if 'conn' in locals():
+        if conn:
             conn.close()
+        if pool:
+            pool.closeall()
+        stop_fixtures()
+        metrics.export()
 
 if __name__ == "__main__":
     main()
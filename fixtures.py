@@ -0,0 +1,392 @@
+import json
+import hashlib
+import threading
+from decimal import Decimal
+from datetime import datetime, date
+
+import metrics
+from metrics import log_event
+
+# Record/replay of everything the reports exchange with Postgres, Google Sheets and Slack.
+# --record PATH runs live and saves every query result, sheet write and Slack response to a
+# JSON fixture; --replay PATH serves the same run from the fixture without touching any
+# external service, so formatting and delivery can be profiled offline at any roster size.
+#
+# db.connect_db/create_pool, notifier.send_to_slack and error_logging_demo.open_sheet consult
+# active() and hand their real implementation to the fixture, which wraps or replaces it.
+# A replay leaves no trace in the production history or monitoring: snapshots, anomaly scoring
+# and the Prometheus textfile are turned off for the rest of the process.
+FIXTURE_VERSION = 1
+
+_active = None
+
+def active():
+    """Returns the recorder or replayer installed for this process, if any."""
+    return _active
+
+def add_fixture_arguments(parser):
+    """Adds the shared --record and --replay options to a script's parser."""
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument('--record', metavar='FIXTURE',
+                       help="Run live and save every query result, sheet write and Slack response to FIXTURE")
+    group.add_argument('--replay', metavar='FIXTURE',
+                       help="Serve the database, Google Sheets and Slack from a recorded FIXTURE instead of the live services; "
+                            "no snapshot, anomaly check or Prometheus textfile is written")
+
+def start_fixtures(args):
+    """Installs the recorder or replayer requested on the command line."""
+    global _active
+    if args.record:
+        _active = Recorder(args.record)
+    elif args.replay:
+        _active = Replayer(args.replay)
+        # Otherwise a replay would add a fake run to the anomaly baseline and overwrite the
+        # production histograms. Anomaly scoring reads the same setting.
+        import snapshots
+        snapshots.SNAPSHOT_DIR = None
+        metrics.TEXTFILE_DIR = None
+    else:
+        return None
+    # Names must be looked up the same way in both runs, so the on-disk name cache is bypassed
+    from display_names import DisplayNameCache, set_cache
+    set_cache(DisplayNameCache())
+    return _active
+
+def stop_fixtures():
+    """Saves a recording and uninstalls the active fixture."""
+    global _active
+    if isinstance(_active, Recorder):
+        _active.save()
+    elif isinstance(_active, Replayer):
+        log_event('fixture_replayed', path=_active.path, statements=len(_active.used), sheet_rows=_active.sheet_rows)
+    _active = None
+
+def encode_value(value):
+    """Encodes a result cell as JSON, tagging the types JSON can't represent."""
+    if isinstance(value, datetime):
+        return {'$datetime': value.isoformat()}
+    if isinstance(value, date):
+        return {'$date': value.isoformat()}
+    if isinstance(value, Decimal):
+        return {'$decimal': str(value)}
+    return value
+
+def decode_value(value):
+    if isinstance(value, dict) and len(value) == 1:
+        if '$datetime' in value:
+            return datetime.fromisoformat(value['$datetime'])
+        if '$date' in value:
+            return date.fromisoformat(value['$date'])
+        if '$decimal' in value:
+            return Decimal(value['$decimal'])
+    return value
+
+def statement_key(sql, params):
+    """Identifies a statement by its text and parameters."""
+    text = ' '.join(sql.split())
+    encoded = json.dumps(params, default=str, sort_keys=True)
+    return hashlib.sha1(f"{text}\0{encoded}".encode()).hexdigest()
+
+def sql_key(sql):
+    """Identifies a statement by its text alone, for the replay fallback."""
+    return hashlib.sha1(' '.join(sql.split()).encode()).hexdigest()
+
+class RecordedResponse:
+    """The parts of a requests.Response the Slack sender reads."""
+
+    def __init__(self, status_code, text):
+        self.status_code = status_code
+        self.text = text
+        self.ok = status_code < 400
+        self.headers = {}
+
+    def json(self):
+        return json.loads(self.text)
+
+class Recorder:
+    """Forwards to the live services and records what they return."""
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.statements = []  # [{'key', 'sql_key', 'rows'}] in execution order
+        self.sheet_writes = []
+        self.sheet_url = None
+        self.slack = []
+
+    def record_statement(self, sql, params, rows):
+        entry = {'key': statement_key(sql, params), 'sql_key': sql_key(sql),
+                 'rows': None if rows is None else [[encode_value(value) for value in row] for row in rows]}
+        with self.lock:
+            self.statements.append(entry)
+
+    def connect(self, connect):
+        return RecordingConnection(connect(), self)
+
+    def pool(self, max_connections, create_pool):
+        return RecordingPool(create_pool(max_connections), self)
+
+    def sheet(self, open_sheet):
+        return RecordingSheet(open_sheet(), self)
+
+    def post(self, url, payload, headers, post_json):
+        response = post_json(url, payload, headers=headers)
+        with self.lock:
+            self.slack.append({'payload': payload, 'status': response.status_code, 'response': response.text})
+        return response
+
+    def save(self):
+        with open(self.path, 'w') as f:
+            json.dump({
+                'version': FIXTURE_VERSION,
+                'statements': self.statements,
+                'sheet_url': self.sheet_url,
+                'sheet_writes': self.sheet_writes,
+                'slack': self.slack,
+            }, f, default=str)
+        log_event('fixture_recorded', path=self.path, statements=len(self.statements),
+                  sheet_writes=len(self.sheet_writes), slack_posts=len(self.slack))
+
+class BufferedCursor:
+    """Serves fetches from rows already held in memory."""
+
+    def __init__(self):
+        self.rows = []
+        self.position = 0
+        self.itersize = 2000
+
+    def fetchone(self):
+        if self.position >= len(self.rows):
+            return None
+        self.position += 1
+        return self.rows[self.position - 1]
+
+    def fetchall(self):
+        rows = self.rows[self.position:]
+        self.position = len(self.rows)
+        return rows
+
+    def __iter__(self):
+        while True:
+            row = self.fetchone()
+            if row is None:
+                return
+            yield row
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class RecordingCursor(BufferedCursor):
+    """Executes on the real cursor and records each result, serving fetches from the recording.
+
+    Results are fetched in full, so named cursors don't stream while recording.
+    """
+
+    def __init__(self, cursor, recorder):
+        super().__init__()
+        self.cursor = cursor
+        self.recorder = recorder
+
+    def execute(self, sql, params=None):
+        self.cursor.execute(sql, params)
+        # Named cursors have no description until the first fetch
+        if self.cursor.description is None and not self.cursor.name:
+            rows = None
+        else:
+            rows = self.cursor.fetchall()
+        self.recorder.record_statement(sql, params, rows)
+        self.rows = rows or []
+        self.position = 0
+
+    def close(self):
+        self.cursor.close()
+
+class RecordingConnection:
+    """Wraps a live connection so its cursors record what they fetch."""
+
+    def __init__(self, conn, recorder):
+        self.conn = conn
+        self.recorder = recorder
+
+    def cursor(self, name=None):
+        return RecordingCursor(self.conn.cursor(name=name) if name else self.conn.cursor(), self.recorder)
+
+    @property
+    def closed(self):
+        return self.conn.closed
+
+    def commit(self):
+        self.conn.commit()
+
+    def rollback(self):
+        self.conn.rollback()
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        self.conn.__enter__()
+        return self
+
+    def __exit__(self, *exc):
+        return self.conn.__exit__(*exc)
+
+class RecordingPool:
+    """Hands out recording wrappers around the pool's live connections."""
+
+    def __init__(self, pool, recorder):
+        self.pool = pool
+        self.recorder = recorder
+        self.wrapped = {}
+
+    def getconn(self):
+        conn = self.pool.getconn()
+        self.wrapped[id(conn)] = conn
+        return RecordingConnection(conn, self.recorder)
+
+    def putconn(self, conn, close=False):
+        self.pool.putconn(self.wrapped.pop(id(conn.conn)), close=close)
+
+    def closeall(self):
+        self.pool.closeall()
+
+class RecordingSheet:
+    """Forwards sheet writes to the worksheet and records them."""
+
+    def __init__(self, sheet, recorder):
+        self.sheet = sheet
+        self.recorder = recorder
+        recorder.sheet_url = self.url
+
+    @property
+    def url(self):
+        return self.sheet.url
+
+    def append_rows(self, values, value_input_option='RAW'):
+        self.sheet.append_rows(values, value_input_option=value_input_option)
+        with self.recorder.lock:
+            self.recorder.sheet_writes.append(values)
+
+class Replayer:
+    """Serves recorded results in place of the live services."""
+
+    def __init__(self, path):
+        with open(path) as f:
+            fixture = json.load(f)
+        if fixture.get('version') != FIXTURE_VERSION:
+            raise ValueError(f"{path} is not a version {FIXTURE_VERSION} fixture")
+        self.path = path
+        self.lock = threading.Lock()
+        # Results are consumed in recorded order; a statement run more often than recorded gets
+        # its last result again
+        self.by_key = {}
+        self.by_sql = {}
+        for entry in fixture['statements']:
+            self.by_key.setdefault(entry['key'], []).append(entry)
+            self.by_sql.setdefault(entry['sql_key'], []).append(entry)
+        self.used = set()
+        self.sheet_url = fixture['sheet_url'] or f"replay:{path}"
+        self.slack = list(fixture['slack'])
+        self.sheet_rows = 0
+
+    def _take(self, entries):
+        for entry in entries:
+            if id(entry) not in self.used:
+                self.used.add(id(entry))
+                return entry
+        return entries[-1]
+
+    def result(self, sql, params):
+        """Returns the recorded rows for a statement, or None for statements without results.
+
+        Statements whose parameters differ from the recording (e.g. other watermarks) fall
+        back to the next unused result of the same SQL text.
+        """
+        with self.lock:
+            entries = self.by_key.get(statement_key(sql, params)) or self.by_sql.get(sql_key(sql))
+            if not entries:
+                raise LookupError(f"statement not in fixture {self.path}: {' '.join(sql.split())[:120]}")
+            entry = self._take(entries)
+        if entry['rows'] is None:
+            return None
+        return [tuple(decode_value(value) for value in row) for row in entry['rows']]
+
+    def connect(self, connect):
+        return ReplayConnection(self)
+
+    def pool(self, max_connections, create_pool):
+        return ReplayPool(self)
+
+    def sheet(self, open_sheet):
+        return ReplaySheet(self)
+
+    def post(self, url, payload, headers, post_json):
+        with self.lock:
+            recorded = self.slack.pop(0) if self.slack else {'status': 200, 'response': '{"ok": true}'}
+        return RecordedResponse(recorded['status'], recorded['response'])
+
+class ReplayCursor(BufferedCursor):
+    """Cursor answering every statement from the fixture."""
+
+    def __init__(self, replayer):
+        super().__init__()
+        self.replayer = replayer
+
+    def execute(self, sql, params=None):
+        self.rows = self.replayer.result(sql, params) or []
+        self.position = 0
+
+class ReplayConnection:
+    """Connection stand-in whose cursors replay the fixture."""
+
+    def __init__(self, replayer):
+        self.replayer = replayer
+        self.closed = False
+
+    def cursor(self, name=None):
+        return ReplayCursor(self.replayer)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+class ReplayPool:
+    def __init__(self, replayer):
+        self.replayer = replayer
+
+    def getconn(self):
+        return ReplayConnection(self.replayer)
+
+    def putconn(self, conn, close=False):
+        pass
+
+    def closeall(self):
+        pass
+
+class ReplaySheet:
+    """Accepts sheet writes and only counts them."""
+
+    def __init__(self, replayer):
+        self.replayer = replayer
+        self.url = replayer.sheet_url
+
+    def append_rows(self, values, value_input_option='RAW'):
+        with self.replayer.lock:
+            self.replayer.sheet_rows += len(values)
@@ -0,0 +1,247 @@
+import re
+import os
+import argparse
+from dotenv import load_dotenv
+
+import metrics
+from db import connect_db, set_account
+from error_logging_demo import explain_cost
+from metrics import timer, log_event
+from query_plans import REPORT_QUERIES
+from roster import load_roster
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Indexes supporting the predicates the report queries use. Partial indexes bake in the
+# constant filters (status = 'failed', deleted_at IS NULL, ...), so they only hold the rows
+# the reports read. 'queries' are the REPORT_QUERIES keys used to estimate each index's benefit.
+CANDIDATES = [
+    {
+        'name': 'audiences_live_account_updated_idx',
+        'table': 'pf.audiences',
+        'columns': ['account_id', 'updated_at'],
+        'include': ['slug'],
+        'where': "deleted_at IS NULL AND is_used = 'false'",
+        'queries': ['audience.account_summary', 'audience.audience_summary'],
+    },
+    {
+        'name': 'audiences_deleted_account_idx',
+        'table': 'pf.audiences',
+        'columns': ['account_id', 'deleted_at'],
+        'include': [],
+        'where': "deleted_at IS NOT NULL",
+        'queries': [],  # Serves the rollup's changed-accounts probe
+    },
+    {
+        'name': 'email_queue_failed_account_idx',
+        'table': 'pf.email_queue_id_status',
+        'columns': ['account_id', 'status_update_at'],
+        'include': [],
+        'where': "status = 'failed'",
+        'queries': ['error_logging.email_random', 'error_logging.email_min',
+                    'error_logging.combined_random', 'error_logging.combined_min'],
+    },
+    {
+        'name': 'whatsapp_wamid_failed_account_idx',
+        'table': 'pf.whatsapp_wamid_status',
+        'columns': ['account_id', 'status_update_at'],
+        'include': [],
+        'where': "status = 'failed' AND errors IS NOT NULL",
+        'queries': ['error_logging.whatsapp_random', 'error_logging.whatsapp_min',
+                    'error_logging.combined_random', 'error_logging.combined_min'],
+    },
+    {
+        'name': 'sms_queue_failed_account_idx',
+        'table': 'pf.sms_queue_id_status',
+        'columns': ['account_id', 'status_update_at'],
+        'include': [],
+        'where': "status = 'failed'",
+        'queries': ['error_logging.sms_random', 'error_logging.sms_min',
+                    'error_logging.combined_random', 'error_logging.combined_min'],
+    },
+    {
+        'name': 'wh_ecom_order_account_date_idx',
+        'table': 'pf.wh_ecom_order',
+        'columns': ['account_id', 'order_date'],
+        'include': [],
+        'where': None,
+        'queries': ['order_customer_sync.freshness_full'],
+    },
+    {
+        'name': 'wh_customer_account_created_idx',
+        'table': 'pf.wh_customer',
+        'columns': ['account_id', 'cust_created_at'],
+        'include': [],
+        'where': None,
+        'queries': ['order_customer_sync.freshness_full'],
+    },
+]
+
+INDEXDEF_PATTERN = re.compile(r"USING \w+ \((?P<columns>.*?)\)(?: INCLUDE \((?P<include>.*?)\))?(?: WHERE (?P<where>.*))?$")
+
+def candidate_ddl(candidate, concurrently=True):
+    """Returns the CREATE INDEX statement for a candidate."""
+    ddl = "CREATE INDEX CONCURRENTLY IF NOT EXISTS" if concurrently else "CREATE INDEX"
+    ddl += f" {candidate['name']} ON {candidate['table']} ({', '.join(candidate['columns'])})"
+    if candidate['include']:
+        ddl += f" INCLUDE ({', '.join(candidate['include'])})"
+    if candidate['where']:
+        ddl += f" WHERE {candidate['where']}"
+    return ddl
+
+def predicate_terms(predicate):
+    """Returns a predicate's AND-ed conditions in a normalized form, or None for a predicate using OR.
+
+    Matches the way pg_indexes deparses predicates: parentheses and casts are dropped,
+    keywords lower-cased and quoted booleans unquoted. Quoted literals are otherwise kept as they are.
+    """
+    parts = re.split(r"('(?:[^']|'')*')", predicate or '')
+    text = ''
+    for index, part in enumerate(parts):
+        if index % 2:
+            text += {"'true'": 'true', "'false'": 'false'}.get(part.lower(), part)
+        else:
+            part = re.sub(r"::[a-z_]+(?: varying)?(?:\[\])?", '', part.lower())
+            text += re.sub(r"[()]", ' ', part)
+    text = ' '.join(text.split())
+    if not text:
+        return set()
+    if re.search(r"\bor\b", text):
+        return None
+    return set(re.split(r"\s+and\s+", text))
+
+def fetch_indexes(cursor, tables):
+    """Returns {table: [(index name, key columns, predicate)]} from pg_indexes."""
+    cursor.execute("""
+        SELECT schemaname || '.' || tablename, indexname, indexdef
+        FROM pg_indexes
+        WHERE schemaname || '.' || tablename = ANY(%s);
+    """, (list(tables),))
+    indexes = {table: [] for table in tables}
+    for table, name, indexdef in cursor.fetchall():
+        match = INDEXDEF_PATTERN.search(indexdef)
+        if not match:
+            continue
+        columns = [column.strip().split()[0].strip('"') for column in match.group('columns').split(',')]
+        indexes[table].append((name, columns, match.group('where')))
+    return indexes
+
+def covering_index(candidate, existing):
+    """Returns the name of an existing index that already serves the candidate, or None.
+
+    An index serves it when its leading key columns match the candidate's and it is either
+    not partial or each condition of its predicate is one of the candidate's, so the report
+    queries' filters imply it. Predicates using OR only match when identical.
+    """
+    width = len(candidate['columns'])
+    wanted = predicate_terms(candidate['where'])
+    for name, columns, where in existing:
+        if columns[:width] != candidate['columns']:
+            continue
+        if where is None:
+            return name
+        terms = predicate_terms(where)
+        if terms == wanted or (terms is not None and wanted is not None and terms <= wanted):
+            return name
+    return None
+
+def hypopg_available(cursor):
+    cursor.execute("SELECT EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'hypopg');")
+    return cursor.fetchone()[0]
+
+def estimate_benefit(cursor, candidate, account_id, baseline):
+    """Returns (cost before, cost after) of the candidate's queries with the index created hypothetically.
+
+    baseline caches the costs without hypothetical indexes across candidates.
+    """
+    queries = {}
+    for key in candidate['queries']:
+        report, name = key.split('.')
+        queries[key] = REPORT_QUERIES[report][name]
+
+    for key, (query, params) in queries.items():
+        if key not in baseline:
+            baseline[key] = explain_cost(cursor, query, params(account_id))
+    before = sum(baseline[key] for key in queries)
+
+    cursor.execute("SELECT * FROM hypopg_create_index(%s);", (candidate_ddl(candidate, concurrently=False),))
+    try:
+        after = sum(explain_cost(cursor, query, params(account_id)) for query, params in queries.values())
+    finally:
+        cursor.execute("SELECT hypopg_reset();")
+    return before, after
+
+def advise(conn, account_id):
+    """Checks every candidate against the existing indexes and estimates the missing ones' benefit.
+
+    Returns a list of recommendation dicts, most beneficial first.
+    """
+    recommendations = []
+    try:
+        with conn.cursor() as cursor:
+            indexes = fetch_indexes(cursor, {candidate['table'] for candidate in CANDIDATES})
+            use_hypopg = hypopg_available(cursor)
+            if not use_hypopg:
+                log_event('warning', stage='advise', error="hypopg is not installed; benefits are not estimated")
+            set_account(cursor, account_id)
+
+            baseline = {}
+            for candidate in CANDIDATES:
+                existing = covering_index(candidate, indexes[candidate['table']])
+                recommendation = {'name': candidate['name'], 'table': candidate['table'],
+                                  'ddl': candidate_ddl(candidate), 'covered_by': existing,
+                                  'cost_before': None, 'cost_after': None}
+                if existing is None and use_hypopg and candidate['queries']:
+                    with timer('hypothetical_plan', index=candidate['name']):
+                        recommendation['cost_before'], recommendation['cost_after'] = \
+                            estimate_benefit(cursor, candidate, account_id, baseline)
+                recommendations.append(recommendation)
+    finally:
+        conn.rollback()
+
+    def benefit(recommendation):
+        if recommendation['cost_before'] is None:
+            return 0.0
+        return recommendation['cost_before'] - recommendation['cost_after']
+    return sorted(recommendations, key=benefit, reverse=True)
+
+def format_ddl(recommendations):
+    """Renders the missing indexes as a SQL script, annotated with their estimated benefit."""
+    lines = ["-- Indexes recommended for the report queries, most beneficial first"]
+    for recommendation in recommendations:
+        if recommendation['covered_by']:
+            continue
+        if recommendation['cost_before'] is not None:
+            before, after = recommendation['cost_before'], recommendation['cost_after']
+            saving = (before - after) / before * 100 if before else 0.0
+            lines.append(f"-- estimated cost of served queries: {before:.2f} -> {after:.2f} ({saving:.0f}% lower)")
+        else:
+            lines.append("-- benefit not estimated")
+        lines.append(recommendation['ddl'] + ";")
+    return "\n".join(lines) + "\n"
+
+def main():
+    parser = argparse.ArgumentParser(description="Recommends indexes for the report queries and estimates their benefit with hypopg.")
+    parser.add_argument('--account', type=int, default=None,
+                        help="Account whose context the hypothetical plans run in (default: first roster account)")
+    parser.add_argument('--output', default='index_recommendations.sql', help="SQL file the recommended DDL is written to")
+    args = parser.parse_args()
+    metrics.set_report('index_advisor')
+
+    conn = connect_db()
+    try:
+        recommendations = advise(conn, args.account or load_roster()[0])
+    finally:
+        conn.close()
+
+    for recommendation in recommendations:
+        log_event('index_recommendation', **recommendation)
+    with open(args.output, 'w') as f:
+        f.write(format_ddl(recommendations))
+    log_event('index_recommendations_written', path=os.path.abspath(args.output),
+              missing=sum(1 for recommendation in recommendations if not recommendation['covered_by']))
+    metrics.export()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+import os
+import json
+import time
+import threading
+from datetime import datetime, timezone
+from contextlib import contextmanager
+
+# Lightweight instrumentation shared by the report scripts. Phases are timed with timer(),
+# every timing is logged as a JSON line and folded into a histogram, and export() writes the
+# histograms to METRICS_TEXTFILE_DIR for the Prometheus node_exporter textfile collector.
+#
+# Keep label sets small: per-query timers carry a 'query' label, per-account timers an
+# 'account' label, never both, so the number of series grows with the roster or the query
+# count rather than their product.
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+TEXTFILE_DIR = os.getenv('METRICS_TEXTFILE_DIR')
+LOG_PHASES = os.getenv('METRICS_LOG_PHASES', '1') != '0'
+# Distinguishes processes running the same report, such as shards, in labels and file names
+WORKER = os.getenv('METRICS_WORKER')
+
+class Histogram:
+    """Cumulative bucketed durations in the Prometheus histogram layout."""
+
+    def __init__(self):
+        self.bucket_counts = [0] * len(BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        for index, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                self.bucket_counts[index] += 1
+        self.count += 1
+        self.sum += seconds
+        self.max = max(self.max, seconds)
+
+_histograms = {}  # (report, phase, ((label, value), ...)) -> Histogram
+_last_run = {}  # report -> unix time of the last export
+_lock = threading.Lock()
+_report = 'unknown'
+
+def set_report(name):
+    """Sets the report name attached to subsequent timings and log lines."""
+    global _report
+    _report = name
+
+def log_event(event, **fields):
+    """Writes one structured JSON log line to stdout."""
+    record = {'ts': datetime.now(timezone.utc).isoformat(), 'report': _report, 'event': event}
+    if WORKER:
+        record['worker'] = WORKER
+    record.update(fields)
+    print(json.dumps(record, default=str), flush=True)
+
+def observe(phase, seconds, **labels):
+    """Records a duration for the phase under the current report."""
+    key = (_report, phase, tuple(sorted((name, str(value)) for name, value in labels.items())))
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = Histogram()
+        histogram.observe(seconds)
+
+@contextmanager
+def timer(phase, **labels):
+    """Times the block as one observation of the phase, logging it with its outcome."""
+    started = time.perf_counter()
+    status = 'ok'
+    try:
+        yield
+    except BaseException:
+        status = 'error'
+        raise
+    finally:
+        seconds = time.perf_counter() - started
+        observe(phase, seconds, **labels)
+        if LOG_PHASES:
+            log_event('phase', phase=phase, seconds=round(seconds, 6), status=status, **labels)
+
+def summary():
+    """Returns the current histograms as plain dicts, one per phase and label set."""
+    with _lock:
+        return [
+            {'report': report, 'phase': phase, 'labels': dict(labels), 'count': histogram.count,
+             'sum': round(histogram.sum, 6), 'max': round(histogram.max, 6)}
+            for (report, phase, labels), histogram in sorted(_histograms.items())
+        ]
+
+def _label_string(pairs):
+    def escape(value):
+        return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return '{' + ','.join(f'{name}="{escape(value)}"' for name, value in pairs) + '}'
+
+def _worker_labels():
+    return (('worker', WORKER),) if WORKER else ()
+
+def render_textfile(report):
+    """Renders the report's histograms in the Prometheus text exposition format."""
+    lines = [
+        "# HELP report_phase_duration_seconds Duration of report phases.",
+        "# TYPE report_phase_duration_seconds histogram",
+    ]
+    with _lock:
+        for (name, phase, labels), histogram in sorted(_histograms.items()):
+            if name != report:
+                continue
+            pairs = (('report', report), ('phase', phase)) + _worker_labels() + labels
+            for bound, count in zip(BUCKETS, histogram.bucket_counts):
+                lines.append(f"report_phase_duration_seconds_bucket{_label_string(pairs + (('le', str(bound)),))} {count}")
+            lines.append(f"report_phase_duration_seconds_bucket{_label_string(pairs + (('le', '+Inf'),))} {histogram.count}")
+            lines.append(f"report_phase_duration_seconds_sum{_label_string(pairs)} {histogram.sum:.6f}")
+            lines.append(f"report_phase_duration_seconds_count{_label_string(pairs)} {histogram.count}")
+        last_run = _last_run.get(report)
+    if last_run is not None:
+        lines += [
+            "# HELP report_last_run_timestamp_seconds Unix time the report last exported its metrics.",
+            "# TYPE report_last_run_timestamp_seconds gauge",
+            f"report_last_run_timestamp_seconds{_label_string((('report', report),) + _worker_labels())} {last_run:.3f}",
+        ]
+    return "\n".join(lines) + "\n"
+
+def export(directory=None):
+    """Logs a summary of the current report's timings and writes its Prometheus textfile.
+
+    The textfile goes to directory (default: METRICS_TEXTFILE_DIR) as <report>.prom, or
+    <report>-<worker>.prom, and is replaced atomically so the collector never reads a partial file.
+    """
+    with _lock:
+        _last_run[_report] = time.time()
+    log_event('metrics_summary', phases=[entry for entry in summary() if entry['report'] == _report])
+
+    directory = directory or TEXTFILE_DIR
+    if not directory:
+        return None
+    path = os.path.join(directory, f"{_report}-{WORKER}.prom" if WORKER else f"{_report}.prom")
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        f.write(render_textfile(_report))
+    os.replace(tmp_path, path)
+    return path
@@ -0,0 +1,110 @@
+import os
+import time
+import threading
+from dotenv import load_dotenv
+import fixtures
+from metrics import timer, log_event
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Slack Bot User OAuth Access Token
+slack_token = os.getenv('SLACK_BOT_TOKEN')  # Slack bot token
+channel_id = os.getenv('SLACK_CHANNEL_ID')  # Slack channel ID
+
+# Connection pool and retry settings
+POOL_SIZE = int(os.getenv('SLACK_POOL_SIZE', '4'))
+MAX_RETRIES = int(os.getenv('SLACK_MAX_RETRIES', '5'))
+BACKOFF_FACTOR = float(os.getenv('SLACK_BACKOFF_FACTOR', '1.0'))
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+_session = None
+_session_lock = threading.Lock()
+
+def get_session(pool_size=None):
+    """Returns the shared keep-alive session, creating it on first use."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            # requests is imported with the first session, not when the reports import this module
+            import requests
+            from requests.adapters import HTTPAdapter
+
+            size = pool_size or POOL_SIZE
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=size, pool_maxsize=size)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            _session = session
+        return _session
+
+def retry_delay(response, attempt):
+    """Seconds to wait before the next attempt, honoring Retry-After when Slack sends it."""
+    retry_after = response.headers.get('Retry-After') if response is not None else None
+    if retry_after:
+        try:
+            return float(retry_after)
+        except ValueError:
+            pass
+    return BACKOFF_FACTOR * (2 ** attempt)
+
+def post_json(url, payload, headers=None):
+    """POSTs a JSON payload on the shared session, retrying 429/5xx responses and connection errors."""
+    import requests
+
+    session = get_session()
+    for attempt in range(MAX_RETRIES + 1):
+        try:
+            response = session.post(url, headers=headers, json=payload, timeout=30)
+        except requests.ConnectionError:
+            if attempt == MAX_RETRIES:
+                raise
+            time.sleep(retry_delay(None, attempt))
+            continue
+        if response.status_code not in RETRY_STATUSES or attempt == MAX_RETRIES:
+            return response
+        time.sleep(retry_delay(response, attempt))
+    return response
+
+def send_to_slack(message, blocks=None, thread_ts=None):
+    """Sends a message to a Slack channel.
+
+    With blocks, message is only the notification fallback; with thread_ts, it is posted as a reply.
+    """
+    url = os.getenv('SLACK_WEBHOOK_URL')  # Slack webhook URL
+    headers = {
+        'Content-Type': 'application/json'
+    }
+    if slack_token:
+        headers['Authorization'] = f'Bearer {slack_token}'
+    payload = {
+        'channel': channel_id,
+        'text': message,
+        'mrkdwn': True
+    }
+    if blocks:
+        payload['blocks'] = blocks
+    if thread_ts:
+        payload['thread_ts'] = thread_ts
+    fixture = fixtures.active()
+    with timer('slack_post'):
+        if fixture:
+            response = fixture.post(url, payload, headers, post_json)
+        else:
+            response = post_json(url, payload, headers=headers)
+    log_event('slack_response', status=response.status_code, body=response.text)
+    if not response.ok or not response.json().get('ok'):
+        raise ValueError(f'Request to Slack returned an error: {response.text}')
+    return response
+
+def send_messages(messages):
+    """Posts the first of slack_tables.render_messages' messages and threads the rest under it.
+
+    Threading needs chat.postMessage, which returns the parent's ts; when the response has
+    none, the remaining messages are posted to the channel in order.
+    """
+    thread_ts = None
+    for index, message in enumerate(messages):
+        response = send_to_slack(message['text'], blocks=message['blocks'], thread_ts=thread_ts)
+        if index == 0:
+            thread_ts = response.json().get('ts')
@@ -1,149 +1,203 @@
-import requests
-import psycopg2
-import os
+import argparse
 from dotenv import load_dotenv
+import metrics
+from db import connect_db, set_account
+from metrics import timer, log_event
+from watermarks import load_watermarks, save_watermarks
+from notifier import send_messages
+from slack_tables import render_messages, message_text
+from display_names import get_display_names
+from snapshots import record_snapshot
+from anomalies import find_anomalies, format_anomalies
+from fixtures import add_fixture_arguments, start_fixtures, stop_fixtures
+from roster import add_roster_arguments, load_roster, resolve_accounts, roster_order, write_shard_output
 
 # Load environment variables from .env file
 load_dotenv()
 
-# Database connection
-try:
-    conn = psycopg2.connect(
-        dbname=os.getenv('DB_NAME'),          # Database name
-        user=os.getenv('DB_USER'),            # Database user
-        password=os.getenv('DB_PASSWORD'),    # Database password
-        host=os.getenv('DB_HOST'),            # Database host
-        port=os.getenv('DB_PORT')             # Database port
-    )
-except Exception as e:
-    print(f"Error connecting to the database: {e}")
-    exit(1)
-
-# Slack Bot User OAuth Access Token
-slack_token = os.getenv('SLACK_BOT_TOKEN')  # Slack bot token
-channel_id = os.getenv('SLACK_CHANNEL_ID')  # Slack channel ID
-
-# Function to send message to Slack
-def send_to_slack(message):
-    url = os.getenv('SLACK_WEBHOOK_URL')  # Slack webhook URL
-    headers = {
-        'Authorization': f'Bearer {slack_token}',
-        'Content-Type': 'application/json'
+# Latest order and customer per account; only rows newer than the given watermarks are probed,
+# and NULL watermarks fall back to a full MAX()
+freshness_query = """
+SELECT
+    (SELECT MAX(order_date)
+     FROM pf.wh_ecom_order
+     WHERE account_id = %(account_id)s
+     AND order_date > COALESCE(%(order_since)s::TIMESTAMP, '-infinity')) AS latest_order_date,
+    (SELECT MAX(cust_created_at)
+     FROM pf.wh_customer
+     WHERE account_id = %(account_id)s
+     AND cust_created_at > COALESCE(%(customer_since)s::TIMESTAMP, '-infinity')) AS latest_customer_created_at,
+    LOCALTIMESTAMP AS checked_at;
+"""
+
+def hours_since(latest, now):
+    """Returns whole hours elapsed between latest and now, or None when latest is unknown."""
+    if latest is None:
+        return None
+    return round((now - latest).total_seconds() / 3600)
+
+def freshness_params(account_id, watermarks, full_refresh=False):
+    """Returns the freshness query parameters for the account's stored watermarks."""
+    stored = {} if full_refresh else watermarks.get(account_id, {})
+    return {
+        'account_id': account_id,
+        'order_since': stored.get('order_date'),
+        'customer_since': stored.get('cust_created_at'),
     }
-    payload = {
-        'channel': channel_id,
-        'text': message,
-        'mrkdwn': True
+
+def sync_row(display_name, account_id, result, watermarks, full_refresh=False):
+    """Turns a freshness query result into a typed row, advancing the account's watermarks."""
+    stored = {} if full_refresh else watermarks.get(account_id, {})
+    latest_order_date, latest_customer_created_at, checked_at = result
+
+    # No newer rows means the stored watermark is still the latest value
+    latest_order_date = latest_order_date or stored.get('order_date')
+    latest_customer_created_at = latest_customer_created_at or stored.get('cust_created_at')
+    watermarks[account_id] = {
+        'order_date': latest_order_date,
+        'cust_created_at': latest_customer_created_at,
     }
-    response = requests.post(url, headers=headers, json=payload)
-    print(response.text)  # Print the full response for debugging
-    if not response.ok or not response.json().get('ok'):
-        raise ValueError(f'Request to Slack returned an error: {response.text}')
 
-# Execute SQL query
-try:
+    return (
+        display_name,
+        account_id,
+        hours_since(latest_order_date, checked_at),
+        hours_since(latest_customer_created_at, checked_at)
+    )
+
+def fetch_account_sync(cursor, display_name, account_id, watermarks, full_refresh=False):
+    """Computes one account's freshness row; the account's context must already be set."""
+    with timer('query', query='freshness'):
+        cursor.execute(freshness_query, freshness_params(account_id, watermarks, full_refresh))
+        result = cursor.fetchone()
+    return sync_row(display_name, account_id, result, watermarks, full_refresh)
+
+def fetch_sync(cursor, account_ids, watermarks=None, full_refresh=False):
+    """Computes hours since the latest order and new customer per account, as typed rows.
+
+    With a watermarks dict, only rows newer than the stored maxima are probed and the dict is
+    updated in place with the newest maxima seen.
+    """
+    if watermarks is None:
+        watermarks = {}
+    display_names = get_display_names(cursor, account_ids)
+
+    rows = []
+    for account_id in account_ids:
+        if account_id not in display_names:
+            continue
+        with timer('account', account=account_id):
+            # Set the account context
+            set_account(cursor, account_id)
+            rows.append(fetch_account_sync(cursor, display_names[account_id], account_id, watermarks, full_refresh))
+    return rows
+
+TITLE = " 📊 Order and Customer Data Latest Sync Report"
+TABLE_HEADER = [
+    "| Account Name        | Account ID          | Last Order    | Last New Customer |",
+    "|---------------------|---------------------|---------------|-------------------|",
+]
+
+def table_lines(rows):
+    """Yields one table line per typed sync row."""
+    for display_name, account_id, hours_since_order, hours_since_customer in rows:
+        last_order = f"{hours_since_order if hours_since_order is not None else 'N/A'} hours ago"
+        last_customer = f"{hours_since_customer if hours_since_customer is not None else 'N/A'} hours ago"
+        yield f"| {display_name or 'N/A':<20} | {account_id:<19} | {last_order:<13} | {last_customer:<18} |"
+
+def build_messages(rows, anomalies=None):
+    """Builds the Slack sync report from typed rows, split into a message and its threaded replies.
+
+    Anomalies, when given, follow the table.
+    """
+    return render_messages(TITLE, TABLE_HEADER, table_lines(rows), footer=format_anomalies(anomalies or []))
+
+def processed_watermarks(watermarks, rows):
+    """Returns only the watermarks of the accounts in rows, so other shards' entries are left alone."""
+    return {row[1]: watermarks[row[1]] for row in rows if row[1] in watermarks}
+
+def collect(conn, account_ids, watermarks=None, full_refresh=False):
+    """Computes typed freshness rows for the accounts, in roster order.
+
+    Uses the incremental path when a watermarks dict is given, updating it in place.
+    """
+    # Execute SQL query
     with conn:
         with conn.cursor() as cursor:
-            # Create a temporary table to hold results
-            cursor.execute("CREATE TEMP TABLE temp_results (result TEXT);")
-
-            cursor.execute("""
-            DO $$
-            DECLARE
-                account_record RECORD;
-                latest_order_date TIMESTAMP;
-                latest_customer_created_at TIMESTAMP;
-                hours_since_order INTEGER;
-                hours_since_customer INTEGER;
-                result TEXT := '';
-            BEGIN
-                FOR account_record IN 
-                    SELECT id AS account_id, display_name
-                    FROM pf.account
-                    WHERE id IN (
-                        221218718049371529,
-                        318376149853931305,
-                        189857344031557017,
-                        308857572440410099,
-                        196436990147692145,
-                        353789014706227026,
-                        328385381068178508
-                    )
-                LOOP
-                    -- Set the account context
-                    PERFORM set_account(account_record.account_id);
-
-                    -- Query for latest order date
-                    SELECT MAX(order_date) INTO latest_order_date
-                    FROM pf.wh_ecom_order
-                    WHERE account_id = account_record.account_id;
-
-                    -- Query for latest customer creation date
-                    SELECT MAX(cust_created_at) INTO latest_customer_created_at
-                    FROM pf.wh_customer
-                    WHERE account_id = account_record.account_id;
-
-                    -- Calculate hours since the latest order and customer creation
-                    IF latest_order_date IS NOT NULL THEN
-                        hours_since_order := EXTRACT(EPOCH FROM (CURRENT_TIMESTAMP - latest_order_date)) / 3600;
-                    ELSE
-                        hours_since_order := NULL;
-                    END IF;
-
-                    IF latest_customer_created_at IS NOT NULL THEN
-                        hours_since_customer := EXTRACT(EPOCH FROM (CURRENT_TIMESTAMP - latest_customer_created_at)) / 3600;
-                    ELSE
-                        hours_since_customer := NULL;
-                    END IF;
-
-                    -- Format the results
-                    result := result || format(
-                        '%s | %s | %s hours ago | %s hours ago\n',
-                        account_record.display_name,
-                        account_record.account_id,
-                        COALESCE(hours_since_order::TEXT, 'N/A'),
-                        COALESCE(hours_since_customer::TEXT, 'N/A')
-                    );
-                END LOOP;
-
-                -- Insert the result into the temporary table
-                INSERT INTO temp_results (result) VALUES (result);
-            END $$;
-            """)
-
-            # Fetch the result from the temporary table
-            cursor.execute("SELECT result FROM temp_results;")
-            result = cursor.fetchone()[0]
-
-            # Manually construct the table as a string for Slack
-            table_str = "```\n"
-            table_str += "| Account Name        | Account ID          | Last Order    | Last New Customer |\n"
-            table_str += "|---------------------|---------------------|---------------|-------------------|\n"
-            
-            # Add rows to the table string
-            for line in result.split('\n'):
-                if line.strip():
-                    display_name, account_id, last_order, last_customer = line.split('|')
-                    table_str += f"| {display_name.strip():<20} | {account_id.strip():<19} | {last_order.strip():<13} | {last_customer.strip():<18} |\n"
-            
-            table_str += "```"
-
-    # Custom message before the table
-    custom_message = " 📊 Order and Customer Data Latest Sync Report\n\n"
-
-    # Concatenate custom message and table
-    full_message = custom_message + table_str
-
-    # Print the message to the terminal
-    print(full_message)
+            with timer('collect', mode='incremental' if watermarks is not None else 'full'):
+                rows = fetch_sync(cursor, account_ids, watermarks, full_refresh)
+    log_event('collected', accounts=len(rows))
+    return roster_order(rows, account_ids)
 
-    # Send the result to Slack
-    send_to_slack(full_message)
+def deliver(rows):
+    """Records the sync report, prints it and posts it to Slack with any anomalies."""
+    # Scored before recording, so the run isn't part of its own baseline
+    anomalies = find_anomalies('order_customer_sync', rows)
+    record_snapshot('order_customer_sync', rows)
+
+    with timer('format'):
+        messages = build_messages(rows, anomalies)
 
-except Exception as e:
-    print(f"Error executing SQL: {e}")
+    # Log the messages for the terminal and log collectors
+    for part, message in enumerate(messages, 1):
+        log_event('slack_message', part=part, parts=len(messages), text=message_text(message))
 
-finally:
-    # Close the database connection
-    if conn:
-        conn.close()
+    # Send the result to Slack
+    send_messages(messages)
+
+def run(conn, watermarks_path=None, full_refresh=False, account_ids=None):
+    """Computes the sync report, prints it and posts it to Slack."""
+    watermarks = load_watermarks(watermarks_path) if watermarks_path else None
+    rows = collect(conn, load_roster() if account_ids is None else account_ids, watermarks, full_refresh)
+    deliver(rows)
+
+    # Persist watermarks only after the report went out
+    if watermarks_path:
+        save_watermarks(watermarks_path, processed_watermarks(watermarks, rows))
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description="Order and customer data latest sync report.")
+    parser.add_argument('--watermarks', metavar='PATH',
+                        help="JSON watermark store; when set, only rows newer than the stored maxima are probed")
+    parser.add_argument('--full-refresh', action='store_true',
+                        help="Ignore stored watermarks, recompute every maximum and rewrite the store")
+    add_roster_arguments(parser)
+    add_fixture_arguments(parser)
+    args = parser.parse_args()
+    metrics.set_report('order_customer_sync')
+    start_fixtures(args)
+
+    # Database connection
+    try:
+        conn = connect_db()
+    except Exception as e:
+        log_event('error', stage='connect', error=str(e))
+        metrics.export()
+        exit(1)
+
+    try:
+        account_ids = resolve_accounts(args, conn)
+        watermarks = load_watermarks(args.watermarks) if args.watermarks else None
+        rows = collect(conn, account_ids, watermarks, args.full_refresh)
+        if args.shard_output:
+            write_shard_output(args.shard_output, 'order_customer_sync', rows)
+        else:
+            deliver(rows)
+
+        # Persist watermarks only after the report went out (or the shard output was written)
+        if args.watermarks:
+            save_watermarks(args.watermarks, processed_watermarks(watermarks, rows))
+
+    except Exception as e:
+        log_event('error', stage='report', error=str(e))
+
+    finally:
+        # Close the database connection
+        if conn:
+            conn.close()
+        stop_fixtures()
+        metrics.export()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+import os
+from itertools import islice
+
+import psycopg
+
+import db
+from display_names import get_display_names
+from error_logging_demo import channel_queries
+from metrics import timer
+
+# libpq pipeline mode (psycopg 3) for the per-account query batches. Every statement of a
+# batch is sent without waiting for the previous result, and the results are read after one
+# sync, so a batch costs about one network round trip instead of one per statement.
+# set_account is session state, so statements run in the order they are queued and a batch
+# may hold several accounts: each account's set_account is followed by its own queries.
+DEFAULT_BATCH_ACCOUNTS = int(os.getenv('PIPELINE_BATCH_ACCOUNTS', '50'))
+
+def connect():
+    """Opens a psycopg 3 connection with the same settings as db.connect_db."""
+    with timer('connect'):
+        return psycopg.connect(**db.connection_kwargs())
+
+def batched(items, size):
+    """Yields lists of up to size items."""
+    iterator = iter(items)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+def execute_pipelined(conn, statements):
+    """Sends (sql, params) statements in one pipeline and returns each one's rows, or None for statements without results."""
+    cursors = []
+    with timer('pipeline_batch'):
+        with conn.pipeline():
+            for sql, params in statements:
+                cursor = conn.cursor()
+                cursor.execute(sql, params)
+                cursors.append(cursor)
+        # Leaving the block synced the pipeline, so every result has arrived
+        return [cursor.fetchall() if cursor.description is not None else None for cursor in cursors]
+
+def collect_errors(conn, account_ids, sampling='random', batch_accounts=DEFAULT_BATCH_ACCOUNTS):
+    """Collects (display_name, errors) per account, pipelining set_account and the channel queries.
+
+    Matches error_logging_demo.collect_serial; names come from the shared cache in one query.
+    """
+    with conn.cursor() as cursor:
+        display_names = get_display_names(cursor, account_ids)
+
+    channels = list(channel_queries[sampling].items())
+    results = []
+    for batch in batched(account_ids, batch_accounts):
+        statements = []
+        for account_id in batch:
+            statements.append(("SELECT set_account(%s);", (account_id,)))
+            statements.extend((query, (account_id,)) for _, query in channels)
+        rows = execute_pipelined(conn, statements)
+
+        per_account = 1 + len(channels)
+        for index, account_id in enumerate(batch):
+            channel_rows = rows[index * per_account + 1:(index + 1) * per_account]
+            errors = {channel: list(channel_result) for (channel, _), channel_result in zip(channels, channel_rows)}
+            results.append((display_names.get(account_id) or 'N/A', errors))
+    conn.rollback()
+    return results
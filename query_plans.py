@@ -0,0 +1,227 @@
+import os
+import sys
+import json
+import fcntl
+import hashlib
+import argparse
+from datetime import datetime
+from dotenv import load_dotenv
+
+import metrics
+import audience_check_demo
+import error_logging_demo
+import order_customer_sync_demo
+from audience_rollup import rollup_summary_query
+from db import connect_db, set_account
+from metrics import timer, log_event
+from notifier import send_to_slack
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Every query the reports run, with a function building its parameters for one account.
+# Set-based queries are planned for a single-account array, as the per-account loops would run them.
+REPORT_QUERIES = {
+    'audience': {
+        'account_summary': (audience_check_demo.account_summary_query, lambda account_id: (account_id,)),
+        'audience_summary': (audience_check_demo.audience_summary_query, lambda account_id: ([account_id],)),
+        'rollup_summary': (rollup_summary_query, lambda account_id: ([account_id],)),
+    },
+    'order_customer_sync': {
+        'freshness_full': (order_customer_sync_demo.freshness_query,
+                           lambda account_id: {'account_id': account_id, 'order_since': None, 'customer_since': None}),
+    },
+    'error_logging': dict(
+        [(f"{channel.lower()}_{sampling}", (query, lambda account_id: (account_id,)))
+         for sampling, queries in error_logging_demo.channel_queries.items()
+         for channel, query in queries.items()] +
+        [(f"combined_{sampling}", (query, lambda account_id: {'account_ids': [account_id]}))
+         for sampling, query in error_logging_demo.combined_queries.items()]
+    ),
+}
+
+# A later plan is flagged when its estimate or reads grow past these ratios of the previous plan
+COST_RATIO = float(os.getenv('PLAN_COST_RATIO', '1.5'))
+BUFFERS_RATIO = float(os.getenv('PLAN_BUFFERS_RATIO', '2.0'))
+HISTORY_LIMIT = 20  # Plans kept per query and account in the store
+
+def walk(node):
+    """Yields the plan node and all of its descendants, depth first."""
+    yield node
+    for child in node.get('Plans', []):
+        yield from walk(child)
+
+def plan_shape(node):
+    """Reduces a plan node to its structure: node type, relation, index and children, without costs."""
+    return [
+        node['Node Type'],
+        node.get('Relation Name'),
+        node.get('Index Name'),
+        [plan_shape(child) for child in node.get('Plans', [])],
+    ]
+
+def fingerprint(plan):
+    """Hashes the plan's structure so that only shape changes, not estimate drift, change it."""
+    shape = json.dumps(plan_shape(plan), separators=(',', ':'))
+    return hashlib.sha1(shape.encode()).hexdigest()[:16]
+
+def summarize_plan(explain_output):
+    """Extracts the figures compared between runs from EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) output."""
+    top = explain_output[0]
+    plan = top['Plan']
+    return {
+        'fingerprint': fingerprint(plan),
+        'total_cost': plan['Total Cost'],
+        'actual_rows': plan.get('Actual Rows'),
+        'shared_hit_blocks': plan.get('Shared Hit Blocks', 0),
+        'shared_read_blocks': plan.get('Shared Read Blocks', 0),
+        'planning_ms': top.get('Planning Time'),
+        'execution_ms': top.get('Execution Time'),
+        'node_types': sorted({node['Node Type'] for node in walk(plan)}),
+        'seq_scans': sorted({node.get('Relation Name') for node in walk(plan) if node['Node Type'] == 'Seq Scan'}),
+        'plan': plan,
+    }
+
+def explain(cursor, query, params):
+    """Runs the query under EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) and returns the parsed output."""
+    cursor.execute("EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + query, params)
+    output = cursor.fetchone()[0]
+    # psycopg2 parses json columns, but not every driver setup does
+    return json.loads(output) if isinstance(output, str) else output
+
+def capture_plans(conn, account_id, reports=None):
+    """Captures the executed plan of every report query for one account.
+
+    Returns {'<report>.<query>': summary}. EXPLAIN ANALYZE runs the queries, so the
+    transaction is rolled back afterwards; all report queries are read-only.
+    """
+    captured = {}
+    try:
+        with conn.cursor() as cursor:
+            set_account(cursor, account_id)
+            for report in reports or REPORT_QUERIES:
+                for name, (query, params) in REPORT_QUERIES[report].items():
+                    key = f"{report}.{name}"
+                    cursor.execute("SAVEPOINT plan_capture;")
+                    try:
+                        with timer('explain', query=key):
+                            output = explain(cursor, query, params(account_id))
+                    except Exception as e:
+                        # A missing optional table (e.g. the rollup) shouldn't stop the other captures
+                        cursor.execute("ROLLBACK TO SAVEPOINT plan_capture;")
+                        log_event('plan_capture_failed', query=key, account=account_id, error=str(e))
+                        continue
+                    captured[key] = summarize_plan(output)
+    finally:
+        conn.rollback()
+    return captured
+
+def compare_plans(previous, current):
+    """Returns human-readable regressions of current against the previous stored plan."""
+    regressions = []
+    if previous['total_cost'] and current['total_cost'] > previous['total_cost'] * COST_RATIO:
+        regressions.append(f"estimated cost {previous['total_cost']:.2f} -> {current['total_cost']:.2f}")
+
+    previous_read = previous['shared_read_blocks'] + previous['shared_hit_blocks']
+    current_read = current['shared_read_blocks'] + current['shared_hit_blocks']
+    if previous_read and current_read > previous_read * BUFFERS_RATIO:
+        regressions.append(f"buffers {previous_read} -> {current_read}")
+
+    if current['fingerprint'] != previous['fingerprint']:
+        added = sorted(set(current['node_types']) - set(previous['node_types']))
+        removed = sorted(set(previous['node_types']) - set(current['node_types']))
+        new_seq_scans = sorted(set(current['seq_scans']) - set(previous['seq_scans']))
+        change = f"plan shape {previous['fingerprint']} -> {current['fingerprint']}"
+        if added:
+            change += f", new nodes: {', '.join(added)}"
+        if removed:
+            change += f", dropped nodes: {', '.join(removed)}"
+        if new_seq_scans:
+            change += f", new seq scans on: {', '.join(new_seq_scans)}"
+        regressions.append(change)
+    return regressions
+
+def load_store(path):
+    """Loads the plan store: {'<report>.<query>': {'<account_id>': [entries, oldest first]}}."""
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        store = json.load(f)
+    # Stores written before history was kept per account hold one list per query
+    for key, history in store.items():
+        if isinstance(history, list):
+            store[key] = {}
+            for entry in history:
+                store[key].setdefault(str(entry['account_id']), []).append(entry)
+    return store
+
+def record_plans(path, account_id, captured):
+    """Compares the captured plans with the latest stored ones and appends them to the store.
+
+    Returns {'<report>.<query>': [regressions]} for the queries that regressed.
+    """
+    regressions = {}
+    captured_at = datetime.now().isoformat(timespec='seconds')
+    with open(f"{path}.lock", 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        store = load_store(path)
+        for key, summary in captured.items():
+            # Plans are compared per account, since row counts differ widely between accounts
+            history = store.setdefault(key, {}).setdefault(str(account_id), [])
+            previous = history[-1] if history else None
+            if previous is not None:
+                found = compare_plans(previous, summary)
+                if found:
+                    regressions[key] = found
+            history.append(dict(summary, account_id=account_id, captured_at=captured_at))
+            del history[:-HISTORY_LIMIT]
+
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(store, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, path)
+    return regressions
+
+def build_message(account_id, regressions):
+    """Builds the Slack notice listing the regressed queries."""
+    message = f"⚠️ Query plan regressions for account {account_id}\n\n```\n"
+    for key, found in sorted(regressions.items()):
+        message += f"{key}:\n"
+        for regression in found:
+            message += f"  - {regression}\n"
+    message += "```"
+    return message
+
+def main():
+    parser = argparse.ArgumentParser(description="Captures executed plans of the report queries and flags regressions.")
+    parser.add_argument('--account', type=int, required=True, help="Account whose context the queries run in")
+    parser.add_argument('--report', action='append', choices=sorted(REPORT_QUERIES),
+                        help="Report whose queries to capture; repeat for several (default: all)")
+    parser.add_argument('--store', default=os.getenv('PLAN_STORE', 'query_plans.json'),
+                        help="JSON file holding the plan history (default: PLAN_STORE or query_plans.json)")
+    parser.add_argument('--notify', action='store_true', help="Post regressions to Slack")
+    parser.add_argument('--fail-on-regression', action='store_true', help="Exit with status 2 when a plan regressed")
+    args = parser.parse_args()
+    metrics.set_report('query_plans')
+
+    conn = connect_db()
+    try:
+        captured = capture_plans(conn, args.account, args.report)
+        regressions = record_plans(args.store, args.account, captured)
+    finally:
+        conn.close()
+
+    for key, summary in sorted(captured.items()):
+        log_event('plan_captured', query=key, account=args.account,
+                  **{field: value for field, value in summary.items() if field != 'plan'})
+    for key, found in sorted(regressions.items()):
+        log_event('plan_regression', query=key, account=args.account, regressions=found)
+    metrics.export()
+
+    if regressions and args.notify:
+        send_to_slack(build_message(args.account, regressions))
+    if regressions and args.fail_on_regression:
+        sys.exit(2)
+
+if __name__ == "__main__":
+    main()
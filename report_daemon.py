@@ -0,0 +1,141 @@
+import os
+import signal
+import argparse
+import threading
+from datetime import datetime, timedelta
+from dotenv import load_dotenv
+
+import audience_check_demo
+import error_logging_demo
+import order_customer_sync_demo
+import metrics
+from metrics import timer, log_event
+from db import get_pool, close_pool, pooled_connection
+from notifier import get_session
+from roster import load_roster
+
+# Load environment variables from .env file
+load_dotenv()
+
+stop_event = threading.Event()
+
+def daily_at(time_of_day):
+    """Returns a schedule function firing once a day at HH:MM local time."""
+    hour, minute = (int(part) for part in time_of_day.split(':'))
+
+    def next_run(now):
+        candidate = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+        if candidate <= now:
+            candidate += timedelta(days=1)
+        return candidate
+    return next_run
+
+def every(minutes):
+    """Returns a schedule function firing every N minutes."""
+    def next_run(now):
+        return now + timedelta(minutes=minutes)
+    return next_run
+
+def build_jobs(args, pool):
+    """Builds the scheduled jobs; each borrows connections from the shared pool."""
+    def audience_job():
+        with pooled_connection(pool) as conn:
+            audience_check_demo.run(conn, args.audience_mode, load_roster(args.roster, conn))
+
+    def errors_job():
+        with pooled_connection(pool) as conn:
+            error_logging_demo.run(conn=conn, pool=pool, combined=args.combined,
+                                   max_workers=args.max_workers, sampling=args.sampling,
+                                   account_ids=load_roster(args.roster, conn))
+
+    def sync_job():
+        with pooled_connection(pool) as conn:
+            order_customer_sync_demo.run(conn, args.watermarks, account_ids=load_roster(args.roster, conn))
+
+    jobs = []
+    if args.audience_at:
+        jobs.append({'name': 'audience_check', 'report': 'audience', 'run': audience_job,
+                     'schedule': daily_at(args.audience_at)})
+    if args.errors_at:
+        jobs.append({'name': 'error_logging', 'report': 'error_logging', 'run': errors_job,
+                     'schedule': daily_at(args.errors_at)})
+    if args.sync_every:
+        jobs.append({'name': 'order_customer_sync', 'report': 'order_customer_sync', 'run': sync_job,
+                     'schedule': every(args.sync_every)})
+    return jobs
+
+def run_job(job):
+    """Runs one job, logging failures without stopping the daemon.
+
+    Histograms accumulate across runs, so each export carries the job's whole history.
+    """
+    metrics.set_report(job['report'])
+    log_event('job_started', job=job['name'])
+    try:
+        with timer('run'):
+            job['run']()
+        log_event('job_finished', job=job['name'])
+    except Exception as e:
+        log_event('error', stage='job', job=job['name'], error=str(e))
+    finally:
+        metrics.export()
+
+def warm_up(jobs):
+    """Opens the long-lived clients up front so the first run doesn't pay for them."""
+    get_session()
+    if any(job['name'] == 'error_logging' for job in jobs):
+        try:
+            error_logging_demo.open_sheet()
+        except Exception as e:
+            log_event('warning', stage='warm_up', error=f"Could not open the Google Sheet yet, will retry on first run: {e}")
+            error_logging_demo.open_sheet.cache_clear()
+
+def main():
+    parser = argparse.ArgumentParser(description="Runs the report scripts as scheduled jobs in one long-lived process.")
+    parser.add_argument('--audience-at', default='09:00', help="Daily time (HH:MM) for the audience check; empty to disable")
+    parser.add_argument('--errors-at', default='08:00', help="Daily time (HH:MM) for error logging; empty to disable")
+    parser.add_argument('--sync-every', type=int, default=60, help="Minutes between order/customer sync checks; 0 to disable")
+    parser.add_argument('--run-now', action='store_true', help="Run every job once at startup before following the schedule")
+    parser.add_argument('--pool-size', type=int, default=int(os.getenv('DB_POOL_SIZE', '8')),
+                        help="Maximum pooled database connections (default: DB_POOL_SIZE or 8)")
+    parser.add_argument('--roster', default=os.getenv('ACCOUNT_ROSTER'),
+                        help="Account roster file, or 'db' to query pf.account before every run")
+    parser.add_argument('--audience-mode', choices=['set', 'loop', 'rollup'], default='loop',
+                        help="See audience_check_demo.py --mode; 'set' and 'rollup' need a role that sees every account's audiences")
+    parser.add_argument('--watermarks', metavar='PATH', help="Watermark store for the sync job")
+    parser.add_argument('--combined', action='store_true', help="Use the combined error query; runs without set_account, so it needs a role that sees every account's rows")
+    parser.add_argument('--sampling', choices=['random', 'min'], default='random')
+    parser.add_argument('--max-workers', type=int, default=1, help="Concurrent accounts for error logging")
+    args = parser.parse_args()
+
+    # Error logging holds one connection while its workers borrow up to max_workers more
+    pool = get_pool(max(args.pool_size, args.max_workers + 1))
+    jobs = build_jobs(args, pool)
+    if not jobs:
+        parser.error("no jobs enabled")
+    warm_up(jobs)
+
+    def request_stop(signum, frame):
+        log_event('stopping', signal=signum)
+        stop_event.set()
+    signal.signal(signal.SIGTERM, request_stop)
+    signal.signal(signal.SIGINT, request_stop)
+
+    now = datetime.now()
+    for job in jobs:
+        job['next'] = now if args.run_now else job['schedule'](now)
+        log_event('scheduled', job=job['name'], next_run=job['next'].isoformat(timespec='minutes'))
+
+    try:
+        while not stop_event.is_set():
+            job = min(jobs, key=lambda job: job['next'])
+            wait = (job['next'] - datetime.now()).total_seconds()
+            if wait > 0 and stop_event.wait(wait):
+                break
+            run_job(job)
+            job['next'] = job['schedule'](datetime.now())
+    finally:
+        close_pool()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+import os
+import json
+from metrics import log_event
+
+# Default roster used when no roster file or query is configured
+DEFAULT_ACCOUNT_IDS = [
+    221218718049371529,
+    318376149853931305,
+    189857344031557017,
+    308857572440410099,
+    196436990147692145,
+    353789014706227026,
+    328385381068178508
+]
+
+# Used by --roster db
+ROSTER_QUERY = os.getenv('ACCOUNT_ROSTER_QUERY', "SELECT id FROM pf.account ORDER BY id;")
+
+def add_roster_arguments(parser):
+    """Adds the shared --roster, --shard and --shard-output options to a script's parser."""
+    parser.add_argument('--roster', default=os.getenv('ACCOUNT_ROSTER'),
+                        help="Account roster: a file with one account ID per line (or a JSON list), or 'db' to query pf.account")
+    parser.add_argument('--shard', type=parse_shard, default=None, metavar='I/N',
+                        help="Only process shard I of N (0-based) of the roster")
+    parser.add_argument('--shard-output', metavar='PATH',
+                        help="Write this shard's typed results to PATH as JSON instead of delivering the report")
+
+def parse_shard(value):
+    """Parses 'I/N' into (index, count)."""
+    index, count = (int(part) for part in value.split('/'))
+    if count < 1 or not 0 <= index < count:
+        raise ValueError(f"invalid shard {value!r}")
+    return index, count
+
+def load_roster(source=None, conn=None):
+    """Loads account IDs from a roster file, from pf.account (source='db'), or the default roster."""
+    if not source:
+        return list(DEFAULT_ACCOUNT_IDS)
+
+    if source == 'db':
+        with conn.cursor() as cursor:
+            cursor.execute(ROSTER_QUERY)
+            account_ids = [row[0] for row in cursor.fetchall()]
+        conn.rollback()
+    else:
+        with open(source) as f:
+            content = f.read()
+        if content.lstrip().startswith('['):
+            account_ids = [int(account_id) for account_id in json.loads(content)]
+        else:
+            account_ids = [
+                int(line.split('#', 1)[0])
+                for line in content.splitlines()
+                if line.split('#', 1)[0].strip()
+            ]
+
+    # An empty roster produces empty reports rather than falling back to the default roster
+    if not account_ids:
+        log_event('warning', stage='roster', error=f"roster {source} is empty")
+    return account_ids
+
+def shard_accounts(account_ids, shard):
+    """Returns the accounts belonging to shard (index, count); stable regardless of roster order."""
+    if shard is None:
+        return account_ids
+    index, count = shard
+    return [account_id for account_id in account_ids if account_id % count == index]
+
+def resolve_accounts(args, conn=None):
+    """Loads the roster named by the parsed arguments and applies --shard."""
+    return shard_accounts(load_roster(args.roster, conn), args.shard)
+
+def write_shard_output(path, report, rows):
+    """Writes one shard's results for a later merge."""
+    with open(path, 'w') as f:
+        json.dump({'report': report, 'rows': rows}, f, default=str)
+
+def read_shard_outputs(paths, report):
+    """Reads and concatenates the rows of every shard output for a report."""
+    rows = []
+    for path in paths:
+        with open(path) as f:
+            output = json.load(f)
+        if output['report'] != report:
+            raise ValueError(f"{path} holds {output['report']} results, expected {report}")
+        rows.extend(output['rows'])
+    return rows
+
+def roster_order(rows, account_ids, key=lambda row: row[1]):
+    """Sorts merged rows into roster order; accounts missing from the roster go last."""
+    position = {account_id: index for index, account_id in enumerate(account_ids)}
+    return sorted(rows, key=lambda row: position.get(key(row), len(position)))
@@ -0,0 +1,92 @@
+import os
+import sys
+import argparse
+import tempfile
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+import audience_check_demo
+import error_logging_demo
+import order_customer_sync_demo
+import metrics
+from metrics import timer, log_event
+from roster import load_roster, read_shard_outputs, roster_order
+
+# Report name -> (module, script file, position of account_id in a result row)
+REPORTS = {
+    'audience': (audience_check_demo, 'audience_check_demo.py', 1),
+    'order_customer_sync': (order_customer_sync_demo, 'order_customer_sync_demo.py', 1),
+    'error_logging': (error_logging_demo, 'error_logging_demo.py', 0),
+}
+
+def run_shards(report, shards, workers, output_dir, script_args):
+    """Runs every shard of a report as its own process and returns the shard output paths."""
+    _, script, _ = REPORTS[report]
+    script_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), script)
+
+    def run_shard(index):
+        output_path = os.path.join(output_dir, f"{report}-shard-{index}-of-{shards}.json")
+        command = [sys.executable, script_path, '--shard', f"{index}/{shards}", '--shard-output', output_path, *script_args]
+        # Each shard exports its own metrics textfile instead of overwriting its siblings'
+        env = dict(os.environ, METRICS_WORKER=f"shard-{index}-of-{shards}")
+        with timer('shard', shard=index):
+            completed = subprocess.run(command, capture_output=True, text=True, env=env)
+        # Shard output is already JSON lines; pass it through untouched
+        sys.stdout.write(completed.stdout)
+        sys.stderr.write(completed.stderr)
+        log_event('shard_finished', shard=index, shards=shards, exit_code=completed.returncode)
+        # The scripts report errors in their logs, so a missing output file is the failure signal
+        if completed.returncode != 0 or not os.path.exists(output_path):
+            raise RuntimeError(f"shard {index}/{shards} of {report} produced no output")
+        return output_path
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(run_shard, range(shards)))
+
+def merge(report, paths, roster=None, dry_run=None):
+    """Merges shard outputs into roster order and delivers the final report."""
+    module, _, id_position = REPORTS[report]
+    with timer('merge'):
+        rows = read_shard_outputs(paths, report)
+    if roster == 'db':
+        # The pf.account roster query orders by id
+        rows.sort(key=lambda row: row[id_position])
+    else:
+        rows = roster_order(rows, load_roster(roster), key=lambda row: row[id_position])
+
+    if report == 'error_logging':
+        module.deliver(rows, dry_run=dry_run)
+    else:
+        module.deliver(rows)
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Splits a report's roster into shards, runs them in parallel processes and merges the results.",
+        epilog="Arguments after '--' are passed to every shard, e.g. -- --mode loop")
+    parser.add_argument('report', choices=sorted(REPORTS))
+    parser.add_argument('--shards', type=int, default=os.cpu_count(), help="Number of shards (default: CPU count)")
+    parser.add_argument('--workers', type=int, default=None, help="Shards run at once (default: all)")
+    parser.add_argument('--roster', default=os.getenv('ACCOUNT_ROSTER'), help="Roster passed to every shard")
+    parser.add_argument('--merge', nargs='+', metavar='SHARD_OUTPUT',
+                        help="Skip running shards and merge outputs produced elsewhere, e.g. on other hosts")
+    parser.add_argument('--dry-run', metavar='CSV_PATH', help="error_logging only: write the merged sheet rows to a CSV")
+    args, script_args = parser.parse_known_args()
+    script_args = [arg for arg in script_args if arg != '--']
+    if args.roster:
+        script_args += ['--roster', args.roster]
+    metrics.set_report(args.report)
+    metrics.WORKER = metrics.WORKER or 'merge'
+
+    try:
+        if args.merge:
+            merge(args.report, args.merge, args.roster, args.dry_run)
+            return
+
+        with tempfile.TemporaryDirectory(prefix=f"{args.report}-shards-") as output_dir:
+            paths = run_shards(args.report, args.shards, args.workers or args.shards, output_dir, script_args)
+            merge(args.report, paths, args.roster, args.dry_run)
+    finally:
+        metrics.export()
+
+if __name__ == "__main__":
+    main()
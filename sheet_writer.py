@@ -0,0 +1,83 @@
+import os
+import csv
+import time
+from collections import deque
+from metrics import timer
+
+# Google Sheets allows 60 write requests per minute per user by default
+DEFAULT_FLUSH_ROWS = int(os.getenv('SHEET_FLUSH_ROWS', '5000'))
+DEFAULT_WRITES_PER_MINUTE = int(os.getenv('SHEET_WRITES_PER_MINUTE', '60'))
+MAX_RETRIES = 5
+
+class CsvSheet:
+    """Local stand-in for a gspread worksheet that appends rows to a CSV file."""
+
+    def __init__(self, path):
+        self.path = path
+        self.url = os.path.abspath(path)
+
+    def append_rows(self, values, value_input_option='RAW'):
+        with open(self.path, 'a', newline='') as f:
+            csv.writer(f).writerows(values)
+
+class SheetWriter:
+    """Buffers rows across accounts and writes them to the sheet in as few API calls as possible.
+
+    Rows are flushed when the buffer reaches flush_rows or when flush() is called. Writes are
+    throttled to writes_per_minute, and quota errors (HTTP 429) are retried with backoff.
+    """
+
+    def __init__(self, sheet, flush_rows=DEFAULT_FLUSH_ROWS, writes_per_minute=DEFAULT_WRITES_PER_MINUTE):
+        self.sheet = sheet
+        self.flush_rows = flush_rows
+        self.writes_per_minute = writes_per_minute
+        self.buffer = []
+        self.write_times = deque()
+        self.api_calls = 0
+
+    @property
+    def url(self):
+        return self.sheet.url
+
+    def append_rows(self, rows):
+        """Adds rows to the buffer, flushing full chunks as they fill up.
+
+        rows may be any iterable, including a generator streaming from a database cursor;
+        at most flush_rows rows are held in memory.
+        """
+        for row in rows:
+            self.buffer.append(row)
+            if len(self.buffer) >= self.flush_rows:
+                self.flush()
+
+    def flush(self):
+        """Writes any buffered rows to the sheet."""
+        if self.buffer:
+            chunk = self.buffer
+            self.buffer = []
+            self._write(chunk)
+
+    def _throttle(self):
+        """Sleeps until another write fits in the per-minute quota."""
+        now = time.monotonic()
+        while self.write_times and now - self.write_times[0] >= 60:
+            self.write_times.popleft()
+        if len(self.write_times) >= self.writes_per_minute:
+            time.sleep(60 - (now - self.write_times[0]))
+            self.write_times.popleft()
+        self.write_times.append(time.monotonic())
+
+    def _write(self, rows):
+        for attempt in range(MAX_RETRIES + 1):
+            self._throttle()
+            try:
+                with timer('sheets_write'):
+                    self.sheet.append_rows(rows, value_input_option='RAW')
+                self.api_calls += 1
+                return
+            except Exception as e:
+                # gspread raises APIError carrying the HTTP response; only quota errors are retried
+                status = getattr(getattr(e, 'response', None), 'status_code', None)
+                if status != 429 or attempt == MAX_RETRIES:
+                    raise
+                time.sleep(2 ** attempt)
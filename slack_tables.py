@@ -0,0 +1,53 @@
+import os
+
+# Renders report tables as Slack block-kit messages that stay within Slack's limits however
+# long the roster is. Rows are packed into ```-fenced section blocks (3000 characters of text
+# each at most), repeating the table header in every block, and the blocks are split across a
+# first message and threaded replies. Rows are consumed from an iterator and joined once per
+# block, so building a large table doesn't copy it over and over.
+SECTION_CHARS = int(os.getenv('SLACK_SECTION_CHARS', '2900'))
+BLOCKS_PER_MESSAGE = int(os.getenv('SLACK_BLOCKS_PER_MESSAGE', '10'))
+SLACK_SECTION_LIMIT = 3000
+
+def section(text):
+    """Returns a mrkdwn section block, truncated to Slack's section text limit."""
+    if len(text) > SLACK_SECTION_LIMIT:
+        text = text[:SLACK_SECTION_LIMIT - 1] + "…"
+    return {'type': 'section', 'text': {'type': 'mrkdwn', 'text': text}}
+
+def code_sections(header_lines, row_lines, limit=SECTION_CHARS):
+    """Packs table lines into code-fenced texts of at most limit characters, each starting with the header."""
+    head = "```\n" + "".join(line + "\n" for line in header_lines)
+    budget = limit - len(head) - len("```")
+    chunk = []
+    size = 0
+    for line in row_lines:
+        line = line[:budget - 1] + "\n"
+        if chunk and size + len(line) > budget:
+            yield head + "".join(chunk) + "```"
+            chunk = []
+            size = 0
+        chunk.append(line)
+        size += len(line)
+    # An empty table still shows its header
+    yield head + "".join(chunk) + "```"
+
+def render_messages(title, header_lines, row_lines, footer=""):
+    """Renders a table as a list of Slack messages: the first carries the title, the rest are replies.
+
+    Each message is a dict with a plain-text 'text' fallback and its 'blocks'.
+    """
+    blocks = [section(title)]
+    blocks.extend(section(text) for text in code_sections(header_lines, row_lines))
+    if footer:
+        blocks.append(section(footer.strip()))
+
+    parts = [blocks[start:start + BLOCKS_PER_MESSAGE] for start in range(0, len(blocks), BLOCKS_PER_MESSAGE)]
+    return [
+        {'text': title if index == 0 else f"{title} ({index + 1}/{len(parts)})", 'blocks': part}
+        for index, part in enumerate(parts)
+    ]
+
+def message_text(message):
+    """Returns the message's blocks as one plain text, for logging."""
+    return "\n\n".join(block['text']['text'] for block in message['blocks'])
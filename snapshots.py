@@ -0,0 +1,114 @@
+import os
+import uuid
+from datetime import datetime, date, timedelta
+
+from metrics import timer, log_event
+
+# Append-only history of typed report results, stored as Parquet under SNAPSHOT_DIR:
+#   <root>/report=<report>/date=<YYYY-MM-DD>/<run time>-<id>.parquet
+# Each run adds one file and never rewrites existing ones, so concurrent runs and shards
+# can't clobber each other. pyarrow is only needed when snapshots are enabled and is
+# imported on first use.
+SNAPSHOT_DIR = os.getenv('SNAPSHOT_DIR')
+
+# Column name -> pyarrow type factory name, per report
+SCHEMAS = {
+    'audience': [
+        ('run_at', 'timestamp'), ('account_id', 'int64'), ('display_name', 'string'),
+        ('total_count', 'int64'), ('updated_today_count', 'int64'), ('not_updated_today_count', 'int64'),
+        ('latest_not_updated', 'timestamp'),
+    ],
+    'order_customer_sync': [
+        ('run_at', 'timestamp'), ('account_id', 'int64'), ('display_name', 'string'),
+        ('hours_since_order', 'int64'), ('hours_since_customer', 'int64'),
+    ],
+    # One row per error code; channels without errors get one row with a zero count,
+    # so a quiet day is recorded rather than missing
+    'error_logging': [
+        ('run_at', 'timestamp'), ('account_id', 'int64'), ('display_name', 'string'),
+        ('channel', 'string'), ('error_code', 'string'), ('error_message', 'string'), ('error_count', 'int64'),
+    ],
+}
+
+def _pyarrow():
+    import pyarrow
+    import pyarrow.dataset
+    import pyarrow.parquet
+    return pyarrow
+
+def _schema(pa, report):
+    types = {'timestamp': lambda: pa.timestamp('us'), 'int64': pa.int64, 'string': pa.string}
+    return pa.schema([(name, types[type_name]()) for name, type_name in SCHEMAS[report]])
+
+def _timestamp(value):
+    # Rows merged from shard outputs carry timestamps as strings
+    return datetime.fromisoformat(value) if isinstance(value, str) else value
+
+def snapshot_records(report, rows, run_at):
+    """Flattens a report's typed result rows into snapshot records."""
+    if report == 'audience':
+        for display_name, account_id, total, updated_today, not_updated_today, latest in rows:
+            yield (run_at, account_id, display_name, total, updated_today, not_updated_today, _timestamp(latest))
+    elif report == 'order_customer_sync':
+        for display_name, account_id, hours_since_order, hours_since_customer in rows:
+            yield (run_at, account_id, display_name, hours_since_order, hours_since_customer)
+    elif report == 'error_logging':
+        for account_id, display_name, errors in rows:
+            for channel, error_list in errors.items():
+                if not error_list:
+                    yield (run_at, account_id, display_name, channel, None, None, 0)
+                for error_code, error_message, error_count in error_list:
+                    yield (run_at, account_id, display_name, channel, error_code, error_message, error_count)
+    else:
+        raise ValueError(f"unknown report {report!r}")
+
+def write_snapshot(report, rows, run_at=None, root=None):
+    """Appends one run's results to the report's dataset and returns the new file's path."""
+    pa = _pyarrow()
+    run_at = run_at or datetime.now()
+    schema = _schema(pa, report)
+    columns = list(zip(*snapshot_records(report, rows, run_at))) or [()] * len(schema)
+    table = pa.table([pa.array(values, type=field.type) for values, field in zip(columns, schema)], schema=schema)
+
+    directory = os.path.join(root or SNAPSHOT_DIR, f"report={report}", f"date={run_at.date().isoformat()}")
+    os.makedirs(directory, exist_ok=True)
+    name = f"{run_at:%H%M%S}-{uuid.uuid4().hex[:8]}.parquet"
+    path = os.path.join(directory, name)
+    tmp_path = os.path.join(directory, f".{name}.tmp")
+    pa.parquet.write_table(table, tmp_path)
+    os.replace(tmp_path, path)  # Readers skip dot files, so they never see a partial write
+    return path
+
+def record_snapshot(report, rows):
+    """Persists the run's results when SNAPSHOT_DIR is set; never fails the report itself."""
+    if not SNAPSHOT_DIR:
+        return None
+    try:
+        with timer('snapshot_write'):
+            path = write_snapshot(report, rows)
+    except Exception as e:
+        log_event('warning', stage='snapshot', error=str(e))
+        return None
+    log_event('snapshot_written', path=path, rows=len(rows))
+    return path
+
+def load_history(report, since=None, until=None, columns=None, root=None):
+    """Loads the report's snapshots between two dates (inclusive) as a pyarrow Table.
+
+    since defaults to 28 days ago and until to today. Only the date partitions in range are
+    opened, and only the requested columns are read.
+    """
+    pa = _pyarrow()
+    since = since or date.today() - timedelta(days=28)
+    until = until or date.today()
+    directory = os.path.join(root or SNAPSHOT_DIR, f"report={report}")
+    schema = _schema(pa, report)
+    if not os.path.isdir(directory):
+        return schema.empty_table().select(columns or schema.names)
+
+    partitioning = pa.dataset.partitioning(pa.schema([('date', pa.string())]), flavor='hive')
+    dataset = pa.dataset.dataset(directory, format='parquet', schema=schema.append(pa.field('date', pa.string())),
+                                 partitioning=partitioning, ignore_prefixes=['.', '_'])
+    # ISO dates compare correctly as strings
+    date_filter = (pa.dataset.field('date') >= since.isoformat()) & (pa.dataset.field('date') <= until.isoformat())
+    return dataset.to_table(columns=columns or schema.names, filter=date_filter)
@@ -0,0 +1,44 @@
+import os
+import json
+import fcntl
+from datetime import datetime
+
+# Persisted per-account watermarks: the last observed maxima of a report's timestamp columns.
+# Stored as JSON so the file can be inspected or edited by hand:
+#   {"221218718049371529": {"order_date": "2024-05-01T10:15:00", ...}, ...}
+
+def load_watermarks(path):
+    """Loads watermarks from a JSON file, returning {account_id: {column: datetime}}."""
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        raw = json.load(f)
+    return {
+        int(account_id): {
+            column: datetime.fromisoformat(value) if value else None
+            for column, value in columns.items()
+        }
+        for account_id, columns in raw.items()
+    }
+
+def save_watermarks(path, watermarks):
+    """Atomically merges watermarks into a JSON file.
+
+    Accounts not in watermarks keep their stored values, so shards covering different
+    accounts can share one file.
+    """
+    with open(f"{path}.lock", 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        merged = load_watermarks(path)
+        merged.update(watermarks)
+        raw = {
+            str(account_id): {
+                column: value.isoformat() if value else None
+                for column, value in columns.items()
+            }
+            for account_id, columns in merged.items()
+        }
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(raw, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, path)